@@ -0,0 +1,120 @@
+"""
+    Load test for proof_server.py: reports requests/sec and latency percentiles per endpoint.
+
+        python benchmark_proofs.py                                  # starts a server in-process
+        python benchmark_proofs.py --url http://127.0.0.1:8080 --clients 16 --seconds 10
+
+    Each client thread keeps one connection open and sends a mix of /proof/<index> (random leaves),
+    /multiproof (--batch random leaves) and /root requests until the time is up.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import requests
+from proof_server import DEFAULT_PRIMES, ProofServer, load_prime_tree
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def run(url, clients=8, seconds=5.0, multiproof_share=0.1, root_share=0.05, batch=16, seed=0):
+    """
+        Runs the load test against the proof server at url and returns the results per endpoint
+    """
+    leaf_count = requests.get(f"{url}/root", timeout=10).json()["leaf_count"]
+    latencies = {"proof": [], "multiproof": [], "root": []}
+    errors = {"proof": 0, "multiproof": 0, "root": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(n):
+        rng = random.Random(seed + n)
+        session = requests.Session()
+        mine = {name: [] for name in latencies}
+        failed = {name: 0 for name in errors}
+        while time.perf_counter() < deadline:
+            roll = rng.random()
+            start = time.perf_counter()
+            try:
+                if roll < root_share:
+                    name = "root"
+                    reply = session.get(f"{url}/root", timeout=10)
+                elif roll < root_share + multiproof_share:
+                    name = "multiproof"
+                    indices = rng.sample(range(leaf_count), min(batch, leaf_count))
+                    reply = session.post(f"{url}/multiproof", json={"indices": indices}, timeout=10)
+                else:
+                    name = "proof"
+                    reply = session.get(f"{url}/proof/{rng.randrange(leaf_count)}", timeout=10)
+                ok = reply.status_code == 200
+            except requests.RequestException:
+                ok = False
+            mine[name].append(time.perf_counter() - start)
+            failed[name] += int(not ok)
+        with lock:
+            for name in latencies:
+                latencies[name].extend(mine[name])
+                errors[name] += failed[name]
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    results = []
+    for name in ("proof", "multiproof", "root", "total"):
+        values = sorted(sum(latencies.values(), []) if name == "total" else latencies[name])
+        results.append({
+            "endpoint": name,
+            "requests": len(values),
+            "errors": sum(errors.values()) if name == "total" else errors[name],
+            "requests_per_sec": len(values) / elapsed,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        })
+    return results
+
+
+def print_results(results):
+    print(f"{'endpoint':12} {'requests':>9} {'req/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for r in results:
+        print(f"{r['endpoint']:12} {r['requests']:9d} {r['requests_per_sec']:10.1f} {r['p50_ms']:9.2f} "
+              f"{r['p99_ms']:9.2f} {r['errors']:7d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the Merkle proof server")
+    parser.add_argument("--url", help="server to test; by default one is started in-process")
+    parser.add_argument("--primes", type=int, default=DEFAULT_PRIMES, help="tree size for the in-process server")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent client threads")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--multiproof-share", type=float, default=0.1, help="fraction of /multiproof requests")
+    parser.add_argument("--root-share", type=float, default=0.05, help="fraction of /root requests")
+    parser.add_argument("--batch", type=int, default=16, help="leaves per /multiproof request")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    server = None
+    url = args.url
+    if url is None:
+        server = ProofServer(load_prime_tree(args.primes)).start()
+        url = server.url
+    try:
+        results = run(url.rstrip("/"), args.clients, args.seconds, args.multiproof_share, args.root_share,
+                      args.batch, args.seed)
+    finally:
+        if server is not None:
+            server.stop()
+    print_results(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,238 @@
+"""
+    Throughput benchmarks for the scan paths, run against recorded JSON-RPC traffic so results are
+    reproducible offline:
+
+        python benchmark_scan.py record scan_cassette.json
+        python benchmark_scan.py replay scan_cassette.json --latency 0.05 --error-rate 0.01 --repeat 5
+
+    record runs every workload once against the live RPCs through a recording CassetteServer
+    (relay transactions are not broadcast) and saves the traffic and the block ranges used.
+    replay runs the same workloads against a CassetteServer answering from the cassette and reports
+    blocks/sec, events/sec and RPC calls per block for each one.
+"""
+import argparse
+import contextlib
+import io
+import json
+import sqlite3
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from web3 import Web3
+import providers
+import bridge
+import listener
+import reading_the_chain
+import block_ordering
+import log_fetcher
+import rpc_batch
+from block_cursor import BlockCursor
+from fee_oracle import stop_oracles
+from relay_ledger import RelayLedger
+from relay_pipeline import stop_trackers
+from rpc_cassette import Cassette, CassetteServer
+from warden_pool import reset_sticky_lanes
+
+
+# Chains the workloads talk to, by providers name
+BENCH_CHAINS = ('avax', 'bsc', 'eth')
+
+# Blocks covered by each workload, counted back from the head when recording
+DEFAULT_BLOCKS = {
+    'bridge_source': 200,
+    'bridge_destination': 500,
+    'listener': 20,
+    'ordered': 5,
+}
+
+
+def contract_address(chain, contract_info="contract_info.json"):
+    return Web3.to_checksum_address(bridge.get_contract_info(chain, contract_info)["address"])
+
+
+def resolve_workloads(blocks=DEFAULT_BLOCKS):
+    """
+        Returns the workload list, with block ranges ending at each chain's current head
+    """
+    heads = {chain: providers.get_web3(chain).eth.block_number for chain in BENCH_CHAINS}
+    source, destination = bridge.CHAINS['source'], bridge.CHAINS['destination']
+    eth = providers.get_web3('eth')
+    # Counted here, so replayed runs do not spend RPC calls on it
+    ordered_txs = sum(
+        eth.eth.get_block_transaction_count(n) for n in range(heads['eth'] - blocks['ordered'] + 1, heads['eth'] + 1)
+    )
+    return [
+        {"name": "bridge.scan_blocks[source]", "kind": "bridge", "chain": "source",
+         "from_block": heads[source] - blocks['bridge_source'] + 1, "blocks": blocks['bridge_source']},
+        {"name": "bridge.scan_blocks[destination]", "kind": "bridge", "chain": "destination",
+         "from_block": heads[destination] - blocks['bridge_destination'] + 1, "blocks": blocks['bridge_destination']},
+        {"name": "listener.scan_blocks", "kind": "listener", "chain": source,
+         "from_block": heads[source] - blocks['listener'] + 1, "to_block": heads[source],
+         "address": contract_address('source')},
+        {"name": "is_ordered_block", "kind": "ordered", "chain": "eth",
+         "from_block": heads['eth'] - blocks['ordered'] + 1, "to_block": heads['eth'], "transactions": ordered_txs},
+        {"name": "block_ordering.analyze_range", "kind": "ordered_range", "chain": "eth",
+         "from_block": heads['eth'] - blocks['ordered'] + 1, "to_block": heads['eth'], "transactions": ordered_txs},
+    ]
+
+
+def run_workload(workload, workdir):
+    """
+        Runs one workload with its local state in workdir.
+        Returns (blocks, events); events counts relayed events, CSV rows or transactions checked.
+    """
+    kind = workload["kind"]
+    if kind == "bridge":
+        chain = workload["chain"]
+        address = contract_address(chain)
+        cursor = BlockCursor(workdir / "cursor.db")
+        cursor.commit(chain, address, workload["from_block"] - 1)
+        ledger_db = workdir / "ledger.db"
+        bridge.scan_blocks(chain, cursor=cursor, max_blocks=workload["blocks"], ledger=RelayLedger(ledger_db),
+                           nonce_db=workdir / "nonces.db", gas_db=workdir / "gas.db")
+        blocks = cursor.get(chain, address) - workload["from_block"] + 1
+        with contextlib.closing(sqlite3.connect(ledger_db)) as conn:
+            events = conn.execute("SELECT COUNT(*) FROM relayed").fetchone()[0]
+        return blocks, events
+    if kind == "listener":
+        eventfile = workdir / "deposit_logs.csv"
+        listener.scan_blocks(workload["chain"], workload["from_block"], workload["to_block"],
+                             workload["address"], eventfile=str(eventfile))
+        rows = len(eventfile.read_text().splitlines()) - 1 if eventfile.exists() else 0
+        return workload["to_block"] - workload["from_block"] + 1, rows
+    if kind == "ordered":
+        w3 = providers.get_web3(workload["chain"])
+        for block_num in range(workload["from_block"], workload["to_block"] + 1):
+            reading_the_chain.is_ordered_block(w3, block_num)
+        return workload["to_block"] - workload["from_block"] + 1, workload["transactions"]
+    if kind == "ordered_range":
+        w3 = providers.get_web3(workload["chain"])
+        _, stats = block_ordering.analyze_range(w3, workload["from_block"], workload["to_block"])
+        return stats["blocks"], stats["transactions"]
+    raise ValueError(f"Unknown workload kind {kind}")
+
+
+def reset_process_state():
+    """
+        Stops the fee samplers and confirmation trackers a workload started, and forgets what it
+        learned about the endpoints (getLogs spans, eth_getBlockReceipts support, sticky warden lanes),
+        so every run sends the same requests as the recording and no background poll is counted
+        against the next one
+    """
+    stop_trackers()
+    stop_oracles()
+    log_fetcher.reset_spans()
+    rpc_batch.reset_block_receipts_support()
+    reset_sticky_lanes()
+
+
+def point_chains_at(server):
+    for chain in BENCH_CHAINS:
+        providers.set_endpoints(chain, server.chain_url(chain))
+
+
+def record(path, blocks=DEFAULT_BLOCKS):
+    upstreams = {chain: providers.RPC_URLS[chain] for chain in BENCH_CHAINS}
+    cassette = Cassette()
+    with CassetteServer(cassette, mode="record", upstreams=upstreams) as server:
+        point_chains_at(server)
+        workloads = resolve_workloads(blocks)
+        for workload in workloads:
+            reset_process_state()
+            with tempfile.TemporaryDirectory() as workdir:
+                print(f"Recording {workload['name']}")
+                try:
+                    run_workload(workload, Path(workdir))
+                finally:
+                    # Sends are not broadcast, so trackers would otherwise poll for them for good
+                    reset_process_state()
+    cassette.meta["workloads"] = workloads
+    cassette.save(path)
+    print(f"Saved {len(cassette.interactions)} distinct requests to {path}")
+
+
+def replay(path, latency=0.0, jitter=0.0, error_rate=0.0, error_kind="rpc", repeat=3, seed=0, quiet=True):
+    """
+        Runs every workload in the cassette repeat times and returns one result dict per workload,
+        with the median successful run's timings. Runs that raise are counted in failed_runs.
+    """
+    cassette = Cassette.load(path)
+    results = []
+    with CassetteServer(cassette, latency=latency, jitter=jitter, error_rate=error_rate,
+                        error_kind=error_kind, seed=seed) as server:
+        point_chains_at(server)
+        for workload in cassette.meta["workloads"]:
+            runs = []
+            failures = []
+            for _ in range(repeat):
+                reset_process_state()
+                cassette.rewind()
+                server.reset_counters()
+                with tempfile.TemporaryDirectory() as workdir:
+                    output = io.StringIO() if quiet else None
+                    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+                        start = time.perf_counter()
+                        try:
+                            blocks, events = run_workload(workload, Path(workdir))
+                            seconds = time.perf_counter() - start
+                        except Exception as e:
+                            # An injected error the scan path did not recover from
+                            failures.append(repr(e))
+                            continue
+                        finally:
+                            # This run's calls only; its background threads are stopped before the next run
+                            counts = (server.rpc_calls, server.http_requests, server.injected_errors)
+                            reset_process_state()
+                runs.append((seconds, blocks, events) + counts)
+            result = {"name": workload["name"], "runs": len(runs), "failed_runs": len(failures), "failures": failures}
+            if runs:
+                seconds, blocks, events, rpc_calls, http_requests, injected = sorted(runs)[len(runs) // 2]
+                result.update({
+                    "seconds": seconds,
+                    "seconds_stdev": statistics.pstdev(run[0] for run in runs),
+                    "blocks": blocks,
+                    "events": events,
+                    "blocks_per_sec": blocks / seconds if seconds else 0.0,
+                    "events_per_sec": events / seconds if seconds else 0.0,
+                    "rpc_calls_per_block": rpc_calls / blocks if blocks else 0.0,
+                    "http_requests": http_requests,
+                    "injected_errors": injected,
+                })
+            results.append(result)
+    return results
+
+
+def print_results(results):
+    print(f"{'workload':34} {'blocks/s':>10} {'events/s':>10} {'calls/block':>12} {'seconds':>9} {'errors':>7}"
+          f" {'failed':>7}")
+    for r in results:
+        if not r["runs"]:
+            print(f"{r['name']:34} {'every run failed':>51} {r['failed_runs']:7d}")
+            continue
+        print(f"{r['name']:34} {r['blocks_per_sec']:10.1f} {r['events_per_sec']:10.1f} "
+              f"{r['rpc_calls_per_block']:12.2f} {r['seconds']:9.3f} {r['injected_errors']:7d} {r['failed_runs']:7d}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the scan paths against recorded RPC traffic")
+    parser.add_argument("mode", choices=["record", "replay"])
+    parser.add_argument("cassette", help="cassette file to write (record) or read (replay)")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every RPC request")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra uniform random latency, in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of RPC requests that fail")
+    parser.add_argument("--error-kind", choices=["rpc", "http"], default="rpc")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    if args.mode == "record":
+        record(args.cassette)
+    else:
+        results = replay(args.cassette, args.latency, args.jitter, args.error_rate, args.error_kind,
+                         args.repeat, args.seed)
+        print_results(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
@@ -0,0 +1,80 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+
+DEFAULT_CURSOR_DB = Path(__file__).parent.absolute() / "block_cursor.db"
+
+
+class BlockCursor:
+    """
+        Persistent per-chain record of the last block height whose events have been handled.
+        Each (chain, contract address) pair has its own cursor, stored in a local SQLite file,
+        so every scan can start exactly one block after the last committed height.
+    """
+
+    def __init__(self, db_path=DEFAULT_CURSOR_DB):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS block_cursor ("
+                " chain TEXT NOT NULL,"
+                " address TEXT NOT NULL,"
+                " height INTEGER NOT NULL,"
+                " PRIMARY KEY (chain, address))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        # A short-lived connection per call keeps the cursor safe to share between processes.
+        # Used as a context manager, a sqlite3 connection only commits; it is closed here.
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, chain, address):
+        """
+            Returns the last committed block height for (chain, address), or None if the
+            cursor has never been committed
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT height FROM block_cursor WHERE chain = ? AND address = ?",
+                (chain, address.lower())
+            ).fetchone()
+        return None if row is None else int(row[0])
+
+    def commit(self, chain, address, height):
+        """
+            Records that every block up to and including 'height' has been handled.
+            The cursor only ever moves forward.
+        """
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO block_cursor (chain, address, height) VALUES (?, ?, ?) "
+                "ON CONFLICT(chain, address) DO UPDATE SET height = MAX(height, excluded.height)",
+                (chain, address.lower(), int(height))
+            )
+
+    def next_range(self, chain, address, latest_block, window_size, max_blocks=None):
+        """
+            Returns (from_block, to_block) for the next scan.
+            Without a committed cursor this falls back to the trailing 'window_size' blocks.
+            When the cursor is far behind, at most 'max_blocks' blocks are returned so a long
+            catch-up is spread across several invocations.
+            from_block > to_block means there is nothing new to scan.
+        """
+        last = self.get(chain, address)
+        if last is None:
+            from_block = max(latest_block - window_size, 0)
+        else:
+            from_block = last + 1
+        to_block = latest_block
+        if max_blocks is not None and to_block - from_block + 1 > max_blocks:
+            to_block = from_block + max_blocks - 1
+        return from_block, to_block
@@ -0,0 +1,226 @@
+"""
+    Checks whether blocks order their transactions by priority fee (see
+    reading_the_chain.is_ordered_block), over whole block ranges:
+
+        python block_ordering.py --sample 2000
+        python block_ordering.py --from-block 19000000 --to-block 19000999 --concurrency 16
+
+    Each block is classified from its eth_getBlockByNumber payload with full transactions, so a
+    block costs one RPC call instead of one plus one per transaction. Blocks are fetched a few per
+    JSON-RPC batch by a bounded pool of threads.
+"""
+import argparse
+import json
+import random
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import providers
+from rpc_batch import batch_call
+
+
+LONDON_BLOCK = 12965000
+
+# Full blocks are large, so only a few go into one JSON-RPC batch
+DEFAULT_BLOCKS_PER_REQUEST = 4
+DEFAULT_CONCURRENCY = 8
+
+
+def _get(tx, key):
+    try:
+        val = tx.get(key) if isinstance(tx, dict) else getattr(tx, key, None)
+        return int(val) if val is not None else None
+    except Exception:
+        return None
+
+
+def _tip(tx, base_fee):
+    mp = _get(tx, 'maxPriorityFeePerGas')
+    mf = _get(tx, 'maxFeePerGas')
+    gp = _get(tx, 'gasPrice')
+    # Type 2 if maxPriorityFeePerGas is present, even if gasPrice is too
+    if mp is not None:
+        if mf is not None:
+            return min(mp, max(mf - base_fee, 0))
+        return max(mp, 0)
+    # Legacy type 0: priority fee = gasPrice - baseFee
+    if gp is not None:
+        return max(gp - base_fee, 0)
+    return 0
+
+
+def fee_sequence(txs, base_fee):
+    """
+        Returns (field, fees): the value each transaction is ranked by, in block order, and its name.
+        gasPrice before EIP-1559 or when every transaction carries one, else the effective priority fee.
+    """
+    if base_fee is None:
+        return "gasPrice", [_get(tx, 'gasPrice') or 0 for tx in txs]
+    base_fee = int(base_fee)
+    gas_prices = [_get(tx, 'gasPrice') for tx in txs]
+    if all(gp is not None for gp in gas_prices):
+        return "gasPrice", gas_prices
+    return "priorityFee", [_tip(tx, base_fee) for tx in txs]
+
+
+def first_violation(fees):
+    """
+        Returns the index of the first fee greater than the one before it, or None if fees never increase
+    """
+    for i in range(1, len(fees)):
+        if fees[i] > fees[i - 1]:
+            return i
+    return None
+
+
+def classify_block(block):
+    """
+        Returns the verdict for one block fetched with full_transactions=True:
+        {"block", "ordered", "tx_count", "london", "field", "first_violation"}
+        first_violation is the index of the first transaction paying more than the one before it.
+    """
+    txs = block.get('transactions', [])
+    base_fee = block.get('baseFeePerGas', None)
+    field, fees = fee_sequence(txs, base_fee)
+    violation = first_violation(fees)
+    return {
+        "block": int(block['number']),
+        "ordered": violation is None,
+        "tx_count": len(txs),
+        "london": base_fee is not None,
+        "field": field,
+        "first_violation": violation,
+    }
+
+
+def _classify_chunk(w3, block_numbers):
+    blocks = batch_call(w3, [lambda n=n: w3.eth.get_block(n, full_transactions=True) for n in block_numbers],
+                        return_exceptions=True)
+    verdicts = []
+    for n, block in zip(block_numbers, blocks):
+        if isinstance(block, Exception):
+            verdicts.append({"block": n, "ordered": None, "error": repr(block)})
+        else:
+            verdicts.append(classify_block(block))
+    return verdicts
+
+
+def iter_verdicts(w3, block_numbers, concurrency=DEFAULT_CONCURRENCY,
+                  blocks_per_request=DEFAULT_BLOCKS_PER_REQUEST):
+    """
+        Yields classify_block's verdict for every block in block_numbers, in order.
+        Blocks are fetched blocks_per_request per JSON-RPC batch by concurrency threads, with at most
+        two batches per thread in flight, so memory stays bounded however long the range is. Only
+        verdicts are kept, never the blocks. A block that cannot be fetched gets
+        {"block", "ordered": None, "error"}.
+    """
+    block_numbers = list(block_numbers)
+    chunks = (block_numbers[i:i + blocks_per_request] for i in range(0, len(block_numbers), blocks_per_request))
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for chunk in chunks:
+            pending.append(executor.submit(_classify_chunk, w3, chunk))
+            if len(pending) >= 2 * concurrency:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def summarize(verdicts, seconds=None):
+    """
+        Returns aggregate statistics over verdicts: block, ordered and error counts, the ordered
+        fraction overall and before/after London, and transaction counts
+    """
+    stats = {"blocks": 0, "ordered": 0, "unordered": 0, "errors": 0, "transactions": 0,
+             "pre_london": {"blocks": 0, "ordered": 0}, "post_london": {"blocks": 0, "ordered": 0},
+             "unordered_blocks": []}
+    for v in verdicts:
+        stats["blocks"] += 1
+        if v.get("error"):
+            stats["errors"] += 1
+            continue
+        era = stats["post_london" if v["london"] else "pre_london"]
+        era["blocks"] += 1
+        stats["transactions"] += v["tx_count"]
+        if v["ordered"]:
+            stats["ordered"] += 1
+            era["ordered"] += 1
+        else:
+            stats["unordered"] += 1
+            stats["unordered_blocks"].append(v["block"])
+    classified = stats["blocks"] - stats["errors"]
+    stats["ordered_fraction"] = stats["ordered"] / classified if classified else 0.0
+    for era in (stats["pre_london"], stats["post_london"]):
+        era["ordered_fraction"] = era["ordered"] / era["blocks"] if era["blocks"] else 0.0
+    if seconds is not None:
+        stats["seconds"] = seconds
+        stats["blocks_per_sec"] = stats["blocks"] / seconds if seconds else 0.0
+    return stats
+
+
+def analyze_blocks(w3, block_numbers, concurrency=DEFAULT_CONCURRENCY,
+                   blocks_per_request=DEFAULT_BLOCKS_PER_REQUEST):
+    """
+        Classifies every block in block_numbers. Returns (verdicts, stats), see iter_verdicts and summarize.
+    """
+    start = time.perf_counter()
+    verdicts = list(iter_verdicts(w3, block_numbers, concurrency, blocks_per_request))
+    return verdicts, summarize(verdicts, time.perf_counter() - start)
+
+
+def analyze_range(w3, from_block, to_block, concurrency=DEFAULT_CONCURRENCY,
+                  blocks_per_request=DEFAULT_BLOCKS_PER_REQUEST):
+    """
+        analyze_blocks over from_block..to_block inclusive
+    """
+    return analyze_blocks(w3, range(from_block, to_block + 1), concurrency, blocks_per_request)
+
+
+def sample_blocks(latest, count, first=1, rng=random):
+    """
+        Returns count distinct random block numbers in first..latest, ascending
+    """
+    return sorted(rng.sample(range(first, latest + 1), min(count, latest - first + 1)))
+
+
+def print_stats(stats):
+    print(f"{stats['blocks']} blocks, {stats['transactions']} transactions, {stats['errors']} errors")
+    print(f"ordered: {stats['ordered']} ({stats['ordered_fraction']:.1%}), unordered: {stats['unordered']}")
+    for name in ("pre_london", "post_london"):
+        era = stats[name]
+        print(f"  {name:12} {era['blocks']:7d} blocks, {era['ordered_fraction']:.1%} ordered")
+    if "seconds" in stats:
+        print(f"{stats['seconds']:.2f}s, {stats['blocks_per_sec']:.1f} blocks/s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check which blocks order their transactions by priority fee")
+    parser.add_argument("--chain", default="eth", help="providers chain name")
+    parser.add_argument("--from-block", type=int, help="first block of the range; defaults to --blocks before the head")
+    parser.add_argument("--to-block", type=int, help="last block of the range; defaults to the head")
+    parser.add_argument("--blocks", type=int, default=100, help="range length when --from-block is omitted")
+    parser.add_argument("--sample", type=int, help="check this many random blocks in the range instead of all of them")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="parallel RPC requests")
+    parser.add_argument("--blocks-per-request", type=int, default=DEFAULT_BLOCKS_PER_REQUEST)
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--json", help="also write the verdicts and statistics to this file")
+    args = parser.parse_args()
+
+    w3 = providers.get_web3(args.chain)
+    to_block = args.to_block if args.to_block is not None else w3.eth.block_number
+    if args.from_block is not None:
+        from_block = args.from_block
+    elif args.sample:
+        from_block = 1
+    else:
+        from_block = max(to_block - args.blocks + 1, 0)
+    if args.sample:
+        block_numbers = sample_blocks(to_block, args.sample, from_block, random.Random(args.seed))
+    else:
+        block_numbers = range(from_block, to_block + 1)
+
+    verdicts, stats = analyze_blocks(w3, block_numbers, args.concurrency, args.blocks_per_request)
+    print_stats(stats)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"stats": stats, "verdicts": verdicts}, f, indent=2)
@@ -1,24 +1,38 @@
 from web3 import Web3
-from web3.providers.rpc import HTTPProvider
-from web3.middleware import ExtraDataToPOAMiddleware  # Necessary for POA chains
 from datetime import datetime
 import json
 import pandas as pd
+import providers
+from block_cursor import BlockCursor
+from log_fetcher import LogFetcher
+from rpc_batch import batch_call, get_block_receipts
+from nonce_manager import DEFAULT_NONCE_DB
+from warden_pool import WardenPool
+from gas_profile import DEFAULT_GAS_DB, GasProfiles
+from fee_oracle import get_oracle
+from relay_pipeline import ChainParams
+from relay_ledger import RelayLedger
+from rpc_metrics import METRICS
+from event_decoder import LogQuery, registry_for
+
+
+# The source contract chain is avax, the destination contract chain is bsc
+CHAINS = {'source': 'avax', 'destination': 'bsc'}
+RPC_URLS = {chain: providers.RPC_URLS[name] for chain, name in CHAINS.items()}
+
+# Warden private key
+WARDEN_PK = "0x20f749266735fdb006af4fe73aacc24b4d6aca494e262c4555eee277d87fdbd1"
+
+# Keys relays are spread over, each with its own nonce sequence.
+# Every key listed here must be granted WARDEN_ROLE on both Source and Destination.
+WARDEN_KEYS = [WARDEN_PK]
 
 
 def connect_to(chain):
-    if chain == 'source':  # The source contract chain is avax
-        api_url = "https://api.avax-test.network/ext/bc/C/rpc"  # AVAX C-chain testnet
-    elif chain == 'destination':  # The destination contract chain is bsc
-        # Public RPC for BSC testnet
-        api_url = "https://data-seed-prebsc-1-s1.binance.org:8545/"
-    else:
+    if chain not in CHAINS:
         return None
-
-    w3 = Web3(Web3.HTTPProvider(api_url))
-    # inject the poa compatibility middleware to the innermost layer
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-    return w3
+    # Shared, cached instance with a keep-alive session and the POA middleware already injected
+    return providers.get_web3(CHAINS[chain])
 
 
 def get_contract_info(chain, contract_info):
@@ -35,14 +49,79 @@ def get_contract_info(chain, contract_info):
     return contracts[chain]
 
 
-def scan_blocks(chain, contract_info="contract_info.json"):
+def report_confirmation(fn_name, chain, other_chain, ev, relay_tx_hash, receipt, ledger):
+    """
+        Run by the warden's ConfirmationTracker once the relay of event ev on chain is mined.
+        A relay that reverted or was replaced is taken back out of the ledger, so a later scan retries it.
+    """
+    if receipt is None:
+        print(f"{fn_name}() relay for {ev.tx_hash.hex()} was replaced on {other_chain} before it was mined")
+    elif not receipt.get("status", 1):
+        print(f"{fn_name}() relay for {ev.tx_hash.hex()} reverted on {other_chain}: {relay_tx_hash.hex()}")
+    else:
+        return
+    ledger.forget_relay(chain, relay_tx_hash)
+
+
+def retry_events(w3, ledger, chain, registry, event_name):
+    """
+        Returns the events on chain whose relay failed (see RelayLedger.forget_relay), decoded again
+        from their transactions' receipts in one batch, in block order
+    """
+    keys = set(ledger.retries(chain))
+    if not keys:
+        return []
+    tx_hashes = sorted({tx_hash for tx_hash, _ in keys})
+    receipts = batch_call(w3, [lambda h=h: w3.eth.get_transaction_receipt(h) for h in tx_hashes],
+                          return_exceptions=True)
+    events = []
+    for receipt in receipts:
+        if isinstance(receipt, Exception):
+            print(f"Could not fetch the receipt of an event to retry: {receipt}")
+            continue
+        events.extend(
+            ev for ev in registry.decode_records(receipt["logs"], event_name) if (ev.tx_hash, ev.log_index) in keys
+        )
+    return sorted(events, key=lambda ev: (ev.block_number, ev.log_index))
+
+
+def with_retries(events, retried):
+    """
+        Returns retried followed by the events of events not among them
+    """
+    keys = {(ev.tx_hash, ev.log_index) for ev in retried}
+    return retried + [ev for ev in events if (ev.tx_hash, ev.log_index) not in keys]
+
+
+def scan_blocks(chain, contract_info="contract_info.json", cursor=None, max_blocks=5000, ledger=None,
+                metrics_file=None, nonce_db=DEFAULT_NONCE_DB, warden_keys=None, gas_db=DEFAULT_GAS_DB):
     """
         chain - (string) should be either "source" or "destination"
+        cursor - (BlockCursor) where the last handled block height is stored, defaults to the local SQLite cursor
+        ledger - (RelayLedger) record of events already relayed, defaults to the local SQLite ledger
+        max_blocks - (int) the most blocks a single invocation will scan when catching up
+        nonce_db - path of the SQLite file the wardens' nonce reservations are kept in
+        gas_db - path of the SQLite file learned gas limits are kept in
+        warden_keys - private keys to relay from, defaults to WARDEN_KEYS; events are spread over them by token
+        metrics_file - optional path; a JSON snapshot of rpc_metrics.METRICS is written there when the scan ends
 
         On "source":  listen for Deposit events and call wrap() on destination.
         On "destination": listen for Unwrap events and call withdraw() on source.
+
+        Each invocation scans the blocks after the last committed height, then commits
+        the highest block whose events were all relayed. Events already in the ledger are
+        never relayed twice.
+        RPC calls and the log fetch, nonce fetch, build, sign and send phases are timed in rpc_metrics.METRICS.
     """
+    try:
+        with METRICS.phase(CHAINS.get(chain, chain), "scan"):
+            return _scan_blocks(chain, contract_info, cursor, max_blocks, ledger, nonce_db, warden_keys, gas_db)
+    finally:
+        if metrics_file is not None:
+            METRICS.write_snapshot(metrics_file)
+
 
+def _scan_blocks(chain, contract_info, cursor, max_blocks, ledger, nonce_db, warden_keys, gas_db):
     if chain not in ['source', 'destination']:
         print(f"Invalid chain: {chain}")
         return 0
@@ -60,16 +139,13 @@ def scan_blocks(chain, contract_info="contract_info.json"):
 
     try:
         this_address = Web3.to_checksum_address(this_info["address"])
-        this_abi = this_info["abi"]
         other_address = Web3.to_checksum_address(other_info["address"])
         other_abi = other_info["abi"]
     except KeyError as e:
         print(f"Missing key in contract_info.json: {e}")
         return 0
 
-    # Warden private key 
-   
-    warden_pk = "0x20f749266735fdb006af4fe73aacc24b4d6aca494e262c4555eee277d87fdbd1"
+    warden_keys = warden_keys if warden_keys is not None else WARDEN_KEYS
 
     # Connect to both chains
     w3_this = connect_to(chain)
@@ -79,188 +155,224 @@ def scan_blocks(chain, contract_info="contract_info.json"):
         print("Error: could not connect to one of the chains")
         return 0
 
-    # Derive warden address 
-    warden_acct = w3_this.eth.account.from_key(warden_pk)
-    warden_addr = warden_acct.address
-
     # Build contract objects
-    this_contract = w3_this.eth.contract(address=this_address, abi=this_abi)
     other_contract = w3_other.eth.contract(address=other_address, abi=other_abi)
 
     latest_block = w3_this.eth.block_number
 
-    
+    # Window used only on the very first run, before a cursor has been committed
     if chain == "source":
         window_size = 10
     else:
         window_size = 100
 
-    from_block = max(latest_block - window_size, 0)
-    to_block = latest_block
+    if cursor is None:
+        cursor = BlockCursor()
+    if ledger is None:
+        ledger = RelayLedger()
+
+    # Learn from the receipts of earlier relays that have been mined since, and take the events of
+    # any that reverted or were dropped back out of the ledger so they are retried below.
+    # A failure only means this happens on a later scan.
+    gas_profiles = GasProfiles(gas_db)
+    try:
+        gas_profiles.settle(w3_other, CHAINS[other_chain],
+                            on_failed=lambda tx_hash: ledger.forget_relay(chain, tx_hash))
+    except Exception as e:
+        print(f"Error refreshing gas profiles on {other_chain}: {e}")
+
+    from_block, to_block = cursor.next_range(chain, this_address, latest_block, window_size, max_blocks)
+
+    if from_block > to_block:
+        print(f"[{datetime.utcnow()}] No new blocks on {chain} since block {to_block}")
+        if not ledger.retries(chain):
+            return 1
+
+    # Lowest block with an event we could not handle; the cursor stops just before it
+    failed_block = None
+
+    def commit_cursor():
+        if failed_block is None:
+            cursor.commit(chain, this_address, to_block)
+        elif failed_block > from_block:
+            cursor.commit(chain, this_address, failed_block - 1)
 
     if from_block == to_block:
         print(f"[{datetime.utcnow()}] Scanning block {from_block} on {chain}")
-    else:
+    elif from_block < to_block:
         print(f"[{datetime.utcnow()}] Scanning blocks {from_block}-{to_block} on {chain}")
 
-    # Helper to extract raw tx safely
-    def get_raw_tx(signed_tx):
-        if hasattr(signed_tx, "rawTransaction"):
-            return signed_tx.rawTransaction
-        if isinstance(signed_tx, dict) and "rawTransaction" in signed_tx:
-            return signed_tx["rawTransaction"]
-        if hasattr(signed_tx, "raw_transaction"):
-            return signed_tx.raw_transaction
-        if isinstance(signed_tx, dict) and "raw_transaction" in signed_tx:
-            return signed_tx["raw_transaction"]
-        raise RuntimeError("Could not extract rawTransaction from signed tx")
-
     # ------------------------------------------------------------------
     # SOURCE SIDE: look for Deposit events and call wrap() on destination
     # ------------------------------------------------------------------
     if chain == "source":
+        registry = registry_for(chain, contract_info)
         try:
-            events = this_contract.events.Deposit().get_logs(
-                from_block=from_block,
-                to_block=to_block
-            )
+            # Raw logs are decoded straight into compact DepositRecords
+            deposits = LogQuery(w3_this, registry, "Deposit")
+            with METRICS.phase(CHAINS[chain], "log_fetch"):
+                events = LogFetcher(w3_this).get_logs(deposits, from_block, to_block)
+            # Events whose relay failed on chain go again, ahead of the new ones
+            retried = retry_events(w3_this, ledger, chain, registry, "Deposit")
         except Exception as e:
             # Fatal error fetching logs on Source chain
             print(f"Error fetching Deposit logs on source: {e}")
             return 0  # Fail hard if Source logging fails
 
-        if len(events) == 0:
+        if len(events) == 0 and len(retried) == 0:
             print("No Deposit events found on source in recent blocks")
+            commit_cursor()
+            return 1
+
+        # Drop events a previous run already relayed before any transaction is built
+        new_events = ledger.filter_new(chain, events)
+        if len(new_events) < len(events):
+            print(f"Skipping {len(events) - len(new_events)} Deposit events that were already relayed")
+        if retried:
+            print(f"Retrying {len(retried)} Deposit events whose relay failed")
+        events = with_retries(new_events, retried)
+        if len(events) == 0:
+            commit_cursor()
             return 1
 
+        wardens = WardenPool(warden_keys, w3_other, other_chain, nonce_db)
         try:
-            base_nonce = w3_other.eth.get_transaction_count(warden_addr)
+            with METRICS.phase(CHAINS[other_chain], "nonce_fetch"):
+                wardens.sync()
         except Exception as e:
             # Fatal error: cannot get nonce on destination chain. The RPC is dead.
             print(f"Error fetching nonce on destination: {e}")
             return 0
 
-        for i, ev in enumerate(events):
-            args = ev["args"]
+        calls = []
+        for ev in events:
             # event Deposit(address token, address recipient, uint256 amount)
-            token = args["token"]
-            recipient = args["recipient"]
-            amount = args["amount"]
+            token = Web3.to_checksum_address(ev.token)
+            recipient = Web3.to_checksum_address(ev.recipient)
+            amount = ev.amount
 
-            print(f"Found Deposit on source: tx={ev['transactionHash'].hex()}")
+            print(f"Found Deposit on source: tx={ev.tx_hash.hex()}")
             print(f"  token={token}, recipient={recipient}, amount={amount}")
-
-            try:
-                tx = other_contract.functions.wrap(
-                    token,
-                    recipient,
-                    amount
-                ).build_transaction({
-                    "from": warden_addr,
-                    "nonce": base_nonce + i,
-                    "gas": 300000,
-                    # Always try to fetch current gas price if the RPC allows it
-                    "gasPrice": w3_other.eth.gas_price,
-                    "chainId": w3_other.eth.chain_id,
-                })
-
-                signed = w3_other.eth.account.sign_transaction(tx, private_key=warden_pk)
-                raw_tx = get_raw_tx(signed)
-                tx_hash = w3_other.eth.send_raw_transaction(raw_tx)
-                print(f"Sent wrap() on destination: {tx_hash.hex()}")
-            except Exception as e:
-                # Catch the transaction-sending error but continue the loop
-                print(f"Error sending wrap() tx on destination: {e}. Skipping this event.")
-
+            calls.append((token, recipient, amount))
+
+        # Events are spread over the warden keys by token; build, sign and send overlap across all of them.
+        # Each event goes into the ledger the moment its relay is broadcast; confirmations are followed
+        # in the background
+        results = wardens.relay_all(
+            other_contract, "wrap", calls, [ev.token for ev in events],
+            on_sent=lambda i, tx_hash: ledger.mark(chain, events[i], tx_hash),
+            on_confirmed=lambda i, tx_hash, receipt: report_confirmation(
+                "wrap", chain, other_chain, events[i], tx_hash, receipt, ledger
+            ),
+            chain=CHAINS[other_chain], gas_profiles=gas_profiles,
+            params=ChainParams(w3_other, oracle=get_oracle(w3_other, CHAINS[other_chain]))
+        )
+
+        for ev, result in zip(events, results):
+            if isinstance(result, Exception):
+                # Report the transaction-sending error but keep relaying the other events
+                print(f"Error sending wrap() tx on destination: {result}. Skipping this event.")
+                # A retried event from behind the cursor stays queued and does not hold it back
+                if from_block <= ev.block_number and (failed_block is None or ev.block_number < failed_block):
+                    failed_block = ev.block_number
+            else:
+                print(f"Sent wrap() on destination: {result.hex()}")
+
+        commit_cursor()
         return 1
 
     # ------------------------------------------------------------------
     # DESTINATION SIDE: look for Unwrap events and call withdraw() on source
     # ------------------------------------------------------------------
     else:  # chain == "destination"
-        events = []
+        decoder = registry_for(chain, contract_info)
 
+        def receipt_scan_block(b):
+            # Last resort for a single block the RPC will not return logs for
+            nonlocal failed_block
+            block_events = []
+            try:
+                # eth_getBlockReceipts, or batched eth_getTransactionReceipt when the node lacks it
+                receipts = get_block_receipts(w3_this, b)
+            except Exception as e_block:
+                print(f"  Skipping block {b} (receipt fetch failed): {e_block}")
+                if failed_block is None or b < failed_block:
+                    failed_block = b
+                return block_events
+
+            # Logs are matched on our contract address and the Unwrap topic before anything is decoded
+            for receipt in receipts:
+                block_events.extend(decoder.decode_records(receipt["logs"], "Unwrap"))
+            return block_events
+
+        # Ranges the RPC rejects are bisected; only single blocks fall back to the receipt scan
+        fetcher = LogFetcher(w3_this, block_fallback=receipt_scan_block)
         try:
-            events = this_contract.events.Unwrap().get_logs(
-                from_block=from_block,
-                to_block=to_block
-            )
+            with METRICS.phase(CHAINS[chain], "log_fetch"):
+                events = fetcher.get_logs(LogQuery(w3_this, decoder, "Unwrap"), from_block, to_block)
+            # Events whose relay failed on chain go again, ahead of the new ones
+            retried = retry_events(w3_this, ledger, chain, decoder, "Unwrap")
         except Exception as e:
-            print(f"Primary {window_size}-block log fetch failed: {e}. Falling back to receipt-based scan.")
-
-            events = []
-            # Fallback: scan via transaction receipts
-            for b in range(from_block, to_block + 1):
-                try:
-                    block = w3_this.eth.get_block(b, full_transactions=True)
-                except Exception as e_block:
-                    print(f"  Skipping block {b} (get_block failed): {e_block}")
-                    continue
-
-   
-                for tx in block["transactions"]:
-                    if isinstance(tx, (bytes, str)):  # hash or hex string
-                        tx_hash = tx
-                    else:
-                        # AttributeDict/dict with 'hash'
-                        tx_hash = tx["hash"]
-
-                    try:
-                        receipt = w3_this.eth.get_transaction_receipt(tx_hash)
-                    except Exception as e_receipt:
-                        print(f"    Skipping tx {tx_hash} (receipt failed): {e_receipt}")
-                        continue
-
-                    # Filter logs to only our contract address
-                    for log in receipt["logs"]:
-                        if log["address"].lower() != this_address.lower():
-                            continue
-                        try:
-                            ev = this_contract.events.Unwrap().process_log(log)
-                            events.append(ev)
-                        except Exception:
-                            # Not an Unwrap log (could be other events) – ignore
-                            continue
+            print(f"Error fetching Unwrap logs on destination: {e}")
+            return 0
 
-        if len(events) == 0:
+        if len(events) == 0 and len(retried) == 0:
             print("No Unwrap events found on destination in recent blocks")
+            commit_cursor()
             return 1
 
+        # Drop events a previous run already relayed before any transaction is built
+        new_events = ledger.filter_new(chain, events)
+        if len(new_events) < len(events):
+            print(f"Skipping {len(events) - len(new_events)} Unwrap events that were already relayed")
+        if retried:
+            print(f"Retrying {len(retried)} Unwrap events whose relay failed")
+        events = with_retries(new_events, retried)
+        if len(events) == 0:
+            commit_cursor()
+            return 1
+
+        wardens = WardenPool(warden_keys, w3_other, other_chain, nonce_db)
         try:
-            base_nonce = w3_other.eth.get_transaction_count(warden_addr)
+            with METRICS.phase(CHAINS[other_chain], "nonce_fetch"):
+                wardens.sync()
         except Exception as e:
             # Fatal error: cannot get nonce on source chain. The RPC is dead.
             print(f"Error fetching nonce on source: {e}")
             return 0
 
-        for i, ev in enumerate(events):
-            args = ev["args"]
+        calls = []
+        for ev in events:
             # event Unwrap(address underlying_token, address wrapped_token, address frm, address to, uint256 amount)
-            underlying = args["underlying_token"]
-            recipient = args["to"]
-            amount = args["amount"]
+            underlying = Web3.to_checksum_address(ev.underlying_token)
+            recipient = Web3.to_checksum_address(ev.to)
+            amount = ev.amount
 
-            print(f"Found Unwrap on destination: tx={ev['transactionHash'].hex()}")
+            print(f"Found Unwrap on destination: tx={ev.tx_hash.hex()}")
             print(f"  underlying={underlying}, to={recipient}, amount={amount}")
-
-            try:
-                tx = other_contract.functions.withdraw(
-                    underlying,
-                    recipient,
-                    amount
-                ).build_transaction({
-                    "from": warden_addr,
-                    "nonce": base_nonce + i,
-                    "gas": 300000,
-                    "gasPrice": w3_other.eth.gas_price,
-                    "chainId": w3_other.eth.chain_id,
-                })
-
-                signed = w3_other.eth.account.sign_transaction(tx, private_key=warden_pk)
-                raw_tx = get_raw_tx(signed)
-                tx_hash = w3_other.eth.send_raw_transaction(raw_tx)
-                print(f"Sent withdraw() on source: {tx_hash.hex()}")
-            except Exception as e:
-                print(f"Error sending withdraw() tx on source: {e}. Skipping this event.")
-
+            calls.append((underlying, recipient, amount))
+
+        # Events are spread over the warden keys by token; build, sign and send overlap across all of them.
+        # Each event goes into the ledger the moment its relay is broadcast; confirmations are followed
+        # in the background
+        results = wardens.relay_all(
+            other_contract, "withdraw", calls, [ev.underlying_token for ev in events],
+            on_sent=lambda i, tx_hash: ledger.mark(chain, events[i], tx_hash),
+            on_confirmed=lambda i, tx_hash, receipt: report_confirmation(
+                "withdraw", chain, other_chain, events[i], tx_hash, receipt, ledger
+            ),
+            chain=CHAINS[other_chain], gas_profiles=gas_profiles,
+            params=ChainParams(w3_other, oracle=get_oracle(w3_other, CHAINS[other_chain]))
+        )
+
+        for ev, result in zip(events, results):
+            if isinstance(result, Exception):
+                print(f"Error sending withdraw() tx on source: {result}. Skipping this event.")
+                # A retried event from behind the cursor stays queued and does not hold it back
+                if from_block <= ev.block_number and (failed_block is None or ev.block_number < failed_block):
+                    failed_block = ev.block_number
+            else:
+                print(f"Sent withdraw() on source: {result.hex()}")
+
+        commit_cursor()
         return 1
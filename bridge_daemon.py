@@ -0,0 +1,266 @@
+import asyncio
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from web3 import AsyncWeb3
+from web3.middleware import ExtraDataToPOAMiddleware  # Necessary for POA chains
+from bridge import CHAINS, RPC_URLS, WARDEN_PK, get_contract_info
+from block_cursor import BlockCursor
+from log_fetcher import LogFetcher
+from nonce_manager import NonceManager, is_nonce_gap
+from relay_pipeline import timed_sign_transaction
+from rpc_metrics import METRICS, metrics_middleware
+from relay_ledger import RelayLedger
+
+
+# For each watched chain: the event to watch, the function to call on the other chain,
+# and how to turn the event args into that function's arguments
+RELAYS = {
+    # event Deposit(address token, address recipient, uint256 amount) -> wrap(token, recipient, amount)
+    'source': ("Deposit", "wrap", lambda args: (args["token"], args["recipient"], args["amount"])),
+    # event Unwrap(address underlying_token, address wrapped_token, address frm, address to, uint256 amount)
+    #   -> withdraw(underlying_token, to, amount)
+    'destination': ("Unwrap", "withdraw", lambda args: (args["underlying_token"], args["to"], args["amount"])),
+}
+
+
+def async_connect_to(chain, endpoint=None):
+    """
+        Takes a chain ('source' or 'destination') and returns an AsyncWeb3 instance connected to it.
+        endpoint - optional URL, or an async provider object (e.g. a local test node), to use instead
+                   of the default public RPC
+    """
+    if endpoint is None:
+        endpoint = RPC_URLS[chain]
+    provider = AsyncWeb3.AsyncHTTPProvider(endpoint) if isinstance(endpoint, str) else endpoint
+    w3 = AsyncWeb3(provider)
+    # inject the poa compatibility middleware to the innermost layer
+    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+    w3.middleware_onion.add(metrics_middleware(CHAINS[chain]), name="rpc_metrics")
+    return w3
+
+
+class BridgeDaemon:
+    """
+        Resident bridge that watches source Deposit and destination Unwrap events concurrently
+        in one event loop and relays each to the other chain.
+        Connections, contract objects, the warden account and the chain ids are created once
+        and reused for every poll.
+
+        endpoints - optional dict chain -> URL or async provider, e.g. a local anvil node or
+                    AsyncEthereumTesterProvider for testing
+        poll_interval - seconds between head checks; well under the block time of either chain
+        gas_price_ttl - seconds a fetched gas price is reused before asking the node again
+        sign_workers - size of the process pool that signs relay transactions
+        max_blocks - the most blocks one poll scans when catching up
+    """
+
+    def __init__(self, contract_info="contract_info.json", warden_pk=WARDEN_PK, endpoints=None,
+                 poll_interval=0.5, cursor=None, nonce_db=None, gas_price_ttl=15, sign_workers=4, ledger=None,
+                 max_blocks=5000):
+        endpoints = endpoints or {}
+        self.poll_interval = poll_interval
+        self.max_blocks = max_blocks
+        self.gas_price_ttl = gas_price_ttl
+        self.sign_executor = ProcessPoolExecutor(max_workers=sign_workers)
+        self.cursor = cursor if cursor is not None else BlockCursor()
+        self.ledger = ledger if ledger is not None else RelayLedger()
+        self.w3 = {chain: async_connect_to(chain, endpoints.get(chain)) for chain in RELAYS}
+        self.contracts = {}
+        for chain in RELAYS:
+            info = get_contract_info(chain, contract_info)
+            if info == 0:
+                raise ValueError(f"Could not load contract info for {chain}")
+            self.contracts[chain] = self.w3[chain].eth.contract(
+                address=AsyncWeb3.to_checksum_address(info["address"]), abi=info["abi"]
+            )
+        self.warden_pk = warden_pk
+        self.warden_acct = self.w3['source'].eth.account.from_key(warden_pk)
+        self.warden_addr = self.warden_acct.address
+        self.nonces = {}
+        for chain in RELAYS:
+            kwargs = {} if nonce_db is None else {"db_path": nonce_db}
+            self.nonces[chain] = NonceManager(None, chain, self.warden_addr, **kwargs)
+        self.chain_ids = {}
+        self._gas_prices = {}
+        self._stopping = asyncio.Event()
+
+    async def start(self):
+        """
+            Fetches the per-chain parameters that never change while the daemon runs
+        """
+        for chain, w3 in self.w3.items():
+            self.chain_ids[chain] = await w3.eth.chain_id
+            await self.sync_nonces(chain)
+
+    async def sync_nonces(self, chain):
+        w3 = self.w3[chain]
+        with METRICS.phase(CHAINS[chain], "nonce_fetch"):
+            pending = await w3.eth.get_transaction_count(self.warden_addr, "pending")
+            latest = await w3.eth.get_transaction_count(self.warden_addr, "latest")
+        await asyncio.to_thread(self.nonces[chain].sync, pending, latest)
+
+    async def gas_price(self, chain):
+        """
+            Returns the gas price for chain, refreshed at most every gas_price_ttl seconds
+        """
+        cached = self._gas_prices.get(chain)
+        if cached is None or time.monotonic() - cached[1] > self.gas_price_ttl:
+            cached = (await self.w3[chain].eth.gas_price, time.monotonic())
+            self._gas_prices[chain] = cached
+        return cached[0]
+
+    def stop(self):
+        self._stopping.set()
+
+    async def run(self):
+        """
+            Runs both watchers until stop() is called
+        """
+        await self.start()
+        try:
+            await asyncio.gather(*(self.watch(chain) for chain in RELAYS))
+        finally:
+            self.sign_executor.shutdown(wait=True)
+
+    async def watch(self, chain):
+        """
+            Polls chain for new blocks and relays every watched event in them
+        """
+        w3 = self.w3[chain]
+        contract = self.contracts[chain]
+        event_name = RELAYS[chain][0]
+        fetcher = LogFetcher(w3)
+        window_size = 10 if chain == 'source' else 100
+
+        while not self._stopping.is_set():
+            try:
+                latest_block = await w3.eth.block_number
+                # SQLite calls run in a thread, so a slow disk never stalls the other watcher
+                from_block, to_block = await asyncio.to_thread(
+                    self.cursor.next_range, chain, contract.address, latest_block, window_size, self.max_blocks
+                )
+                if from_block <= to_block:
+                    with METRICS.phase(CHAINS[chain], "log_fetch"):
+                        events = await fetcher.get_logs_async(
+                            getattr(contract.events, event_name), from_block, to_block
+                        )
+                    events = await asyncio.to_thread(self.ledger.filter_new, chain, events)
+                    # Nonces are reserved in event order, then every event is built, signed
+                    # and broadcast concurrently
+                    other_nonces = self.nonces['destination' if chain == 'source' else 'source']
+                    reserved = []
+                    settled = {}
+                    relays = []
+                    try:
+                        for _ in events:
+                            reserved.append(await asyncio.to_thread(other_nonces.reserve))
+                        settled = {nonce: asyncio.get_running_loop().create_future() for nonce in reserved}
+                        relays = [
+                            asyncio.ensure_future(self.relay(chain, ev, nonce, settled))
+                            for ev, nonce in zip(events, reserved)
+                        ]
+                        sent = await asyncio.gather(*relays)
+                    except BaseException:
+                        # Relays that started settle their own nonce; give back every nonce whose
+                        # relay never ran, so later relays do not wait behind the gap
+                        await asyncio.gather(*relays, return_exceptions=True)
+                        for nonce in reserved:
+                            if nonce not in settled or not settled[nonce].done():
+                                other_nonces.release(nonce)
+                        raise
+                    failed = [ev["blockNumber"] for ev, ok in zip(events, sent) if not ok]
+                    failed_block = min(failed) if failed else None
+                    if failed_block is None:
+                        await asyncio.to_thread(self.cursor.commit, chain, contract.address, to_block)
+                    elif failed_block > from_block:
+                        await asyncio.to_thread(self.cursor.commit, chain, contract.address, failed_block - 1)
+            except Exception as e:
+                print(f"[{datetime.utcnow()}] Error watching {chain}: {e}")
+
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def relay(self, chain, ev, nonce, settled=None):
+        """
+            Calls the matching function on the other chain for event ev, using a nonce already
+            reserved for the warden on that chain.
+            settled - optional dict nonce -> Future that relays sent together use to report
+                      whether their transaction was accepted
+            Returns True once the transaction has been broadcast.
+        """
+        settled = settled if settled is not None else {}
+        accepted = False
+        try:
+            accepted = await self._relay(chain, ev, nonce, settled)
+        finally:
+            # Always resolved, so a higher nonce waiting on this one never hangs
+            if nonce in settled and not settled[nonce].done():
+                settled[nonce].set_result(accepted)
+        return accepted
+
+    async def _relay(self, chain, ev, nonce, settled):
+        other_chain = 'destination' if chain == 'source' else 'source'
+        event_name, fn_name, to_call_args = RELAYS[chain]
+        w3_other = self.w3[other_chain]
+        nonces = self.nonces[other_chain]
+        call_args = to_call_args(ev["args"])
+        print(f"Found {event_name} on {chain}: tx={ev['transactionHash'].hex()} args={call_args}")
+
+        label = CHAINS[other_chain]
+        try:
+            with METRICS.phase(label, "build"):
+                tx = await getattr(self.contracts[other_chain].functions, fn_name)(*call_args).build_transaction({
+                    "from": self.warden_addr,
+                    "nonce": nonce,
+                    "gas": 300000,
+                    "gasPrice": await self.gas_price(other_chain),
+                    "chainId": self.chain_ids[other_chain],
+                })
+            raw_tx, sign_seconds = await asyncio.get_running_loop().run_in_executor(
+                self.sign_executor, timed_sign_transaction, tx, self.warden_pk
+            )
+            METRICS.observe_phase(label, "sign", sign_seconds)
+            attempts = 0
+            while True:
+                try:
+                    with METRICS.phase(label, "send"):
+                        tx_hash = await w3_other.eth.send_raw_transaction(raw_tx)
+                    break
+                except Exception as e:
+                    # Nodes that do not queue future nonces reject a send that overtook a lower nonce;
+                    # retry once the lower nonce has been accepted
+                    if not is_nonce_gap(e) or attempts >= 3:
+                        raise
+                    attempts += 1
+                    if nonce - 1 in settled:
+                        if not await settled[nonce - 1]:
+                            raise
+                    else:
+                        await asyncio.sleep(0.5)
+        except asyncio.CancelledError as e:
+            # Shutting down: give the nonce back before the task goes away
+            nonces.fail(nonce, e)
+            raise
+        except Exception as e:
+            print(f"Error sending {fn_name}() tx on {other_chain}: {e}")
+            await asyncio.to_thread(nonces.fail, nonce, e)
+            try:
+                await self.sync_nonces(other_chain)
+            except Exception as e_sync:
+                print(f"Error syncing nonces on {other_chain}: {e_sync}")
+            return False
+        await asyncio.to_thread(nonces.mark_sent, nonce)
+        try:
+            await asyncio.to_thread(self.ledger.mark, chain, ev, tx_hash)
+        except Exception as e:
+            # The transaction is out; the cursor still moves past it
+            print(f"Error recording relay {tx_hash.hex()} in the ledger: {e}")
+        print(f"Sent {fn_name}() on {other_chain}: {tx_hash.hex()}")
+        return True
+
+
+if __name__ == "__main__":
+    asyncio.run(BridgeDaemon().run())
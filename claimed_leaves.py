@@ -0,0 +1,183 @@
+import random
+import sqlite3
+import threading
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+import numpy as np
+from event_decoder import EventRegistry, LogQuery
+from log_fetcher import LogFetcher
+from rpc_batch import batch_call
+
+
+DEFAULT_CLAIMS_DB = Path(__file__).parent.absolute() / "claimed_leaves.db"
+
+
+class ClaimBitmap:
+    """
+        Claimed flags for leaves 0..leaf_count-1, kept as a bitmap alongside a dense array of the
+        unclaimed indices, so marking a leaf and drawing a random unclaimed one are both O(1)
+    """
+
+    def __init__(self, leaf_count, bits=None):
+        self.leaf_count = leaf_count
+        self.bits = bytearray((leaf_count + 7) // 8)
+        # _free holds the unclaimed indices in any order; _slot[i] is i's position in it, or -1
+        self._free = array("q", range(leaf_count))
+        self._slot = array("q", range(leaf_count))
+        if bits is not None:
+            claimed = np.flatnonzero(np.unpackbits(np.frombuffer(bits, dtype=np.uint8), bitorder="little"))
+            for index in claimed[claimed < leaf_count].tolist():
+                self.mark(index)
+
+    def is_claimed(self, index):
+        return bool(self.bits[index >> 3] >> (index & 7) & 1)
+
+    def mark(self, index):
+        """
+            Marks leaf index as claimed; returns False if it already was
+        """
+        if self.is_claimed(index):
+            return False
+        self.bits[index >> 3] |= 1 << (index & 7)
+        slot = self._slot[index]
+        last = self._free[-1]
+        self._free[slot] = last
+        self._slot[last] = slot
+        self._free.pop()
+        self._slot[index] = -1
+        return True
+
+    def unclaimed_count(self):
+        return len(self._free)
+
+    def pick(self, rng=random):
+        """
+            Returns a uniformly random unclaimed leaf index, or None if every leaf is claimed
+        """
+        if not self._free:
+            return None
+        return self._free[rng.randrange(len(self._free))]
+
+
+class ClaimedLeaves:
+    """
+        Which leaves of the prime allowlist have been claimed on the claim contract, so a claimant
+        only ever draws a free one.
+        The first sync() snapshots every leaf's owner with batched getOwnerByPrime calls pinned to
+        one block; later syncs only read the Submission events since the last synced block. The
+        bitmap and that block are kept in a local SQLite file per (chain, contract, version). A new
+        contract version (a new allowlist) starts from a fresh snapshot.
+
+        primes - the allowlist's primes in leaf order (ascending), e.g. generate_primes(n, packed=True)
+    """
+
+    def __init__(self, w3, address, abi, primes, chain="bsc", db_path=DEFAULT_CLAIMS_DB):
+        self.w3 = w3
+        self.chain = chain
+        self.contract = w3.eth.contract(address=address, abi=abi)
+        self.address = self.contract.address
+        self.primes = np.asarray(primes, dtype=np.uint64)
+        self.registry = EventRegistry(self.address, abi)
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self.version = None
+        self.height = None
+        self.bitmap = ClaimBitmap(len(self.primes))
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS claimed_leaves ("
+                " chain TEXT NOT NULL, address TEXT NOT NULL, version TEXT NOT NULL,"
+                " leaf_count INTEGER NOT NULL, height INTEGER NOT NULL, bits BLOB NOT NULL,"
+                " PRIMARY KEY (chain, address, version))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _call(self, fn_name, *args, block="latest"):
+        # Raw eth_call, so it can go into a JSON-RPC batch
+        return lambda: self.w3.eth.call(
+            {"to": self.address, "data": self.contract.encode_abi(fn_name, args=list(args))}, block
+        )
+
+    def index_of(self, prime):
+        """
+            Returns the leaf index of prime, or None if it is not in the allowlist
+        """
+        index = int(np.searchsorted(self.primes, prime))
+        if index < len(self.primes) and int(self.primes[index]) == prime:
+            return index
+        return None
+
+    def _load(self, version):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT leaf_count, height, bits FROM claimed_leaves WHERE chain = ? AND address = ? AND version = ?",
+                (self.chain, self.address.lower(), version.hex())
+            ).fetchone()
+        if row is None or row[0] != len(self.primes):
+            return False
+        self.version, self.height = version, row[1]
+        self.bitmap = ClaimBitmap(len(self.primes), row[2])
+        return True
+
+    def save(self):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO claimed_leaves (chain, address, version, leaf_count, height, bits)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (self.chain, self.address.lower(), self.version.hex(), len(self.primes), self.height,
+                 bytes(self.bitmap.bits))
+            )
+
+    def _snapshot(self, version, block):
+        owners = batch_call(self.w3, [self._call("getOwnerByPrime", int(p), block=block) for p in self.primes])
+        self.version, self.height = version, block
+        self.bitmap = ClaimBitmap(len(self.primes))
+        for index, owner in enumerate(owners):
+            if int.from_bytes(bytes(owner), "big"):
+                self.bitmap.mark(index)
+
+    def sync(self):
+        """
+            Brings the bitmap up to the latest block and saves it. Returns the number of newly claimed leaves.
+        """
+        latest, version = batch_call(self.w3, [lambda: self.w3.eth.block_number, self._call("version")])
+        version = bytes(version)
+        if self.version != version and not self._load(version):
+            self._snapshot(version, latest)
+            self.save()
+            return len(self.primes) - self.bitmap.unclaimed_count()
+        before = self.bitmap.unclaimed_count()
+        if latest > self.height:
+            query = LogQuery(self.w3, self.registry, "Submission")
+            for record in LogFetcher(self.w3).get_logs(query, self.height + 1, latest):
+                if record.version != version:
+                    continue
+                index = self.index_of(record.prime)
+                if index is not None:
+                    self.bitmap.mark(index)
+            self.height = latest
+            self.save()
+        return before - self.bitmap.unclaimed_count()
+
+    def pick(self, rng=random):
+        """
+            Returns a random unclaimed leaf index, or None if every leaf is claimed
+        """
+        return self.bitmap.pick(rng)
+
+    def mark(self, index):
+        """
+            Records a claim seen before its Submission event was synced, e.g. one this process sent
+            and saw mined with status 1. A claim that reverted or has not been mined must not be marked.
+        """
+        if self.bitmap.mark(index) and self.version is not None:
+            self.save()
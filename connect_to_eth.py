@@ -1,7 +1,5 @@
 import json
-from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from web3.providers.rpc import HTTPProvider
+import providers
 
 '''
 If you use one of the suggested infrastructure providers, the url will be of the form
@@ -11,9 +9,8 @@ infura_url = f"https://mainnet.infura.io/v3/{infura_token}"
 '''
 
 def connect_to_eth():
-	url = "https://mainnet.infura.io/v3/198ba796b8a548cbb6b4ce669df25a6e"  # FILL THIS IN
-	w3 = Web3(HTTPProvider(url))
-	assert w3.is_connected(), f"Failed to connect to provider at {url}"
+	# Cached instance on a shared keep-alive session; connectivity is only asserted on first use
+	w3 = providers.get_web3('eth', check_connection=True)
 	return w3
 
 
@@ -26,14 +23,12 @@ def connect_with_middleware(contract_json):
 
 	# TODO complete this method
 	# The first section will be the same as "connect_to_eth()" but with a BNB url
-	bnb_testnet_url = "https://bsc-testnet.infura.io/v3/198ba796b8a548cbb6b4ce669df25a6e"
-	w3 = Web3(HTTPProvider(bnb_testnet_url))
-	assert w3.is_connected(), f"Failed to connect to BNB testnet provider at {bnb_testnet_url}"
+	w3 = providers.get_web3('bsc-infura', check_connection=True)
 
 	# The second section requires you to inject middleware into your w3 object and
 	# create a contract object. Read more on the docs pages at https://web3py.readthedocs.io/en/stable/middleware.html
 	# and https://web3py.readthedocs.io/en/stable/web3.contract.html
-	w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+	# (providers.get_web3 injects the POA middleware once, when the instance is first created)
 	contract = w3.eth.contract(address=address, abi=abi)
 
 	return w3, contract
@@ -0,0 +1,217 @@
+import json
+import threading
+from eth_abi import decode as abi_decode
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+from web3.datastructures import AttributeDict
+from event_records import RECORD_TYPES
+
+
+_registries = {}
+_lock = threading.Lock()
+
+
+def _to_bytes(value):
+    if isinstance(value, str):
+        return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+    return bytes(value)
+
+
+def _word_converter(abi_type, raw=False):
+    """
+        Returns a function turning one 32-byte ABI word into a value of abi_type,
+        or None if abi_type is not a single-word static type.
+        raw - return addresses as 20-byte bytes instead of checksummed strings
+    """
+    if abi_type == "address":
+        if raw:
+            return lambda word: word[12:]
+        return lambda word: to_checksum_address(word[12:])
+    if abi_type == "bool":
+        return lambda word: word[-1] != 0
+    if abi_type.startswith("uint") and "[" not in abi_type:
+        return lambda word: int.from_bytes(word, "big")
+    if abi_type.startswith("int") and "[" not in abi_type:
+        return lambda word: int.from_bytes(word, "big", signed=True)
+    if abi_type.startswith("bytes") and abi_type != "bytes" and "[" not in abi_type:
+        size = int(abi_type[5:])
+        return lambda word: word[:size]
+    return None
+
+
+class EventDecoder:
+    """
+        Decodes logs of one event straight from their topics and data.
+        Indexed arguments are read from topics[1:]; non-indexed arguments of fixed-size types are
+        sliced from consecutive 32-byte words of data, and only events with a dynamic non-indexed
+        argument fall back to eth_abi. Indexed dynamic arguments are returned as their topic hash,
+        as web3 does. Events with an event_records class can also be decoded into compact records.
+    """
+
+    def __init__(self, event_abi):
+        self.name = event_abi["name"]
+        self.topic = event_abi_to_log_topic(event_abi)
+        inputs = event_abi["inputs"]
+        self.names = [i["name"] for i in inputs]
+        self.indexed = []
+        self.data_types = []
+        # (argument position, source, offset) with source "topic" or "data"
+        self._layout = []
+        for position, abi_input in enumerate(inputs):
+            if abi_input.get("indexed"):
+                self._layout.append((position, "topic", len(self.indexed)))
+                self.indexed.append(_word_converter(abi_input["type"]) or bytes)
+            else:
+                self._layout.append((position, "data", len(self.data_types)))
+                self.data_types.append(abi_input["type"])
+        self._data_converters = [_word_converter(t) for t in self.data_types]
+        self._static_data = all(c is not None for c in self._data_converters)
+        self.record_type = RECORD_TYPES.get(self.name)
+        if self.record_type is not None and tuple(self.names) != self.record_type.fields:
+            # Same name as a bridge event, but not the layout its record expects
+            self.record_type = None
+        self._raw_indexed = [_word_converter(i["type"], raw=True) or bytes for i in inputs if i.get("indexed")]
+        self._raw_data_converters = [_word_converter(t, raw=True) for t in self.data_types]
+
+    def _values(self, topics, data, indexed, data_converters):
+        if len(topics) != len(indexed) + 1:
+            return None
+        if self._static_data:
+            if len(data) < 32 * len(self.data_types):
+                return None
+            data_values = [convert(data[32 * i:32 * i + 32]) for i, convert in enumerate(data_converters)]
+        else:
+            data_values = list(abi_decode(self.data_types, data))
+        values = [None] * len(self.names)
+        for position, source, offset in self._layout:
+            if source == "topic":
+                values[position] = indexed[offset](_to_bytes(topics[offset + 1]))
+            else:
+                values[position] = data_values[offset]
+        return values
+
+    def decode_args(self, topics, data):
+        """
+            Returns the event arguments as a dict, or None if topics does not match this event's layout
+        """
+        values = self._values(topics, data, self.indexed, self._data_converters)
+        return None if values is None else dict(zip(self.names, values))
+
+    def decode_record(self, log):
+        """
+            Returns log as an instance of this event's event_records class, or None if it does not fit
+        """
+        if self.record_type is None:
+            raise TypeError(f"No compact record type for event {self.name}")
+        values = self._values(log["topics"], _to_bytes(log["data"]), self._raw_indexed, self._raw_data_converters)
+        if values is None:
+            return None
+        return self.record_type(_to_bytes(log["transactionHash"]), log["logIndex"], log["blockNumber"], *values)
+
+    def decode(self, log):
+        """
+            Returns log decoded in the same shape as web3's event process_log(), or None if it does not fit
+        """
+        args = self.decode_args(log["topics"], _to_bytes(log["data"]))
+        if args is None:
+            return None
+        return AttributeDict({
+            "args": AttributeDict(args),
+            "event": self.name,
+            "logIndex": log["logIndex"],
+            "transactionIndex": log["transactionIndex"],
+            "transactionHash": log["transactionHash"],
+            "address": log["address"],
+            "blockHash": log["blockHash"],
+            "blockNumber": log["blockNumber"],
+        })
+
+
+class EventRegistry:
+    """
+        Maps topic0 to an EventDecoder for every non-anonymous event in a contract's ABI.
+        Logs are matched on emitting address and topic0 before any decoding work, so logs of
+        other contracts or events cost two comparisons.
+    """
+
+    def __init__(self, address, abi):
+        self.address = _to_bytes(address)
+        self.decoders = {}
+        for entry in abi:
+            if entry.get("type") == "event" and not entry.get("anonymous"):
+                decoder = EventDecoder(entry)
+                self.decoders[decoder.topic] = decoder
+        self._by_name = {d.name: d.topic for d in self.decoders.values()}
+
+    def topic(self, event_name):
+        return self._by_name[event_name]
+
+    def _matching(self, logs, event_names):
+        """
+            Yields (decoder, log) for each log emitted by this contract for one of event_names
+        """
+        if isinstance(event_names, str):
+            event_names = [event_names]
+        wanted = None if event_names is None else {self._by_name[n] for n in event_names}
+        for log in logs:
+            topics = log["topics"]
+            if not topics or _to_bytes(log["address"]) != self.address:
+                continue
+            topic0 = _to_bytes(topics[0])
+            if wanted is not None and topic0 not in wanted:
+                continue
+            decoder = self.decoders.get(topic0)
+            if decoder is not None:
+                yield decoder, log
+
+    def decode_logs(self, logs, event_names=None):
+        """
+            Returns the decoded logs emitted by this contract, in order.
+            event_names - optional event name or iterable of names to keep; other events are skipped undecoded
+        """
+        events = (decoder.decode(log) for decoder, log in self._matching(logs, event_names))
+        return [ev for ev in events if ev is not None]
+
+    def decode_records(self, logs, event_names=None):
+        """
+            Same as decode_logs(), but returns event_records instances
+        """
+        records = (decoder.decode_record(log) for decoder, log in self._matching(logs, event_names))
+        return [record for record in records if record is not None]
+
+
+class LogQuery:
+    """
+        Stands in for a contract event class in LogFetcher: fetches the raw logs of one event of
+        registry's contract with eth_getLogs and decodes them into compact records
+    """
+
+    def __init__(self, w3, registry, event_name):
+        self.w3 = w3
+        self.registry = registry
+        self.event_name = event_name
+        self._filter = {
+            "address": to_checksum_address(registry.address),
+            "topics": ["0x" + registry.topic(event_name).hex()],
+        }
+
+    def __call__(self):
+        return self
+
+    def get_logs(self, from_block, to_block):
+        logs = self.w3.eth.get_logs(dict(self._filter, fromBlock=from_block, toBlock=to_block))
+        return self.registry.decode_records(logs, self.event_name)
+
+
+def registry_for(chain, contract_info="contract_info.json"):
+    """
+        Returns the cached EventRegistry for the contract deployed on chain, as listed in contract_info
+    """
+    key = (str(contract_info), chain)
+    with _lock:
+        registry = _registries.get(key)
+        if registry is None:
+            with open(contract_info, "r") as f:
+                info = json.load(f)[chain]
+            registry = EventRegistry(info["address"], info["abi"])
+            _registries[key] = registry
+        return registry
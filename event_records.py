@@ -0,0 +1,86 @@
+from eth_utils import to_checksum_address
+
+
+class EventRecord:
+    """
+        Compact, fixed-layout record of one bridge (or prime claim) event log.
+        Addresses are kept as 20-byte bytes, hashes as 32-byte bytes and amounts as ints, in
+        __slots__ instead of nested AttributeDicts of HexBytes.
+        Subclasses list their arguments in ABI order in fields; the constructor takes the log's
+        transaction hash, log index and block number followed by those arguments.
+    """
+    __slots__ = ("tx_hash", "log_index", "block_number")
+    event = None
+    fields = ()
+
+    def __init__(self, tx_hash, log_index, block_number, *args):
+        if len(args) != len(self.fields):
+            raise TypeError(f"{type(self).__name__} takes {len(self.fields)} event arguments, got {len(args)}")
+        self.tx_hash = tx_hash
+        self.log_index = log_index
+        self.block_number = block_number
+        for name, value in zip(self.fields, args):
+            setattr(self, name, value)
+
+    def args(self):
+        """
+            Returns the event arguments as a dict, with addresses checksummed as web3 reports them
+        """
+        return {
+            name: to_checksum_address(value) if isinstance(value, bytes) and len(value) == 20 else value
+            for name, value in ((name, getattr(self, name)) for name in self.fields)
+        }
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, name) == getattr(other, name) for name in EventRecord.__slots__ + self.fields
+        )
+
+    def __hash__(self):
+        return hash((self.tx_hash, self.log_index))
+
+    def __repr__(self):
+        return (f"{type(self).__name__}(tx=0x{self.tx_hash.hex()}, log_index={self.log_index}, "
+                f"block={self.block_number}, {self.args()})")
+
+
+class DepositRecord(EventRecord):
+    # event Deposit(address indexed token, address indexed recipient, uint256 amount)
+    __slots__ = ("token", "recipient", "amount")
+    event = "Deposit"
+    fields = __slots__
+
+
+class WithdrawalRecord(EventRecord):
+    # event Withdrawal(address indexed token, address indexed recipient, uint256 amount)
+    __slots__ = ("token", "recipient", "amount")
+    event = "Withdrawal"
+    fields = __slots__
+
+
+class UnwrapRecord(EventRecord):
+    # event Unwrap(address indexed underlying_token, address indexed wrapped_token, address frm,
+    #              address indexed to, uint256 amount)
+    __slots__ = ("underlying_token", "wrapped_token", "frm", "to", "amount")
+    event = "Unwrap"
+    fields = __slots__
+
+
+class WrapRecord(EventRecord):
+    # event Wrap(address indexed underlying_token, address indexed wrapped_token, address indexed to, uint256 amount)
+    __slots__ = ("underlying_token", "wrapped_token", "to", "amount")
+    event = "Wrap"
+    fields = __slots__
+
+
+class SubmissionRecord(EventRecord):
+    # Prime claim contract: event Submission(address indexed _from, uint256 prime, bytes32 version)
+    __slots__ = ("_from", "prime", "version")
+    event = "Submission"
+    fields = __slots__
+
+
+# Event name -> record class
+RECORD_TYPES = {
+    cls.event: cls for cls in (DepositRecord, WithdrawalRecord, UnwrapRecord, WrapRecord, SubmissionRecord)
+}
@@ -0,0 +1,139 @@
+import statistics
+import threading
+import time
+from rpc_batch import batch_call
+
+
+# Reward percentile eth_feeHistory is asked for, per target inclusion speed
+SPEEDS = {"slow": 10, "standard": 50, "fast": 90}
+
+_oracles = {}
+_oracles_lock = threading.Lock()
+
+
+class FeeOracle:
+    """
+        Fee parameters for one chain, sampled from eth_feeHistory on a background thread.
+        Each sample reads the last history_blocks blocks' base fees and priority-fee percentiles,
+        plus eth_gasPrice and eth_maxPriorityFeePerGas as fallbacks, in one batch. fees() answers from
+        the latest sample, so senders pay no round trip; only a sample older than ttl (e.g. before
+        the first refresh, or if the sampler keeps failing) is refreshed inline.
+
+        ttl - seconds a sample may be used for
+        refresh_interval - seconds between background samples, defaults to half the ttl
+    """
+
+    def __init__(self, w3, chain, ttl=10, history_blocks=20, refresh_interval=None):
+        self.w3 = w3
+        self.chain = chain
+        self.ttl = ttl
+        self.history_blocks = history_blocks
+        self.refresh_interval = refresh_interval if refresh_interval is not None else ttl / 2
+        self._sample = None
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def _fetch(self):
+        history, gas_price, max_priority = batch_call(self.w3, [
+            lambda: self.w3.eth.fee_history(self.history_blocks, "latest", sorted(SPEEDS.values())),
+            lambda: self.w3.eth.gas_price,
+            lambda: self.w3.eth.max_priority_fee,
+        ], return_exceptions=True)
+        if isinstance(gas_price, Exception):
+            raise gas_price
+        sample = {"gas_price": gas_price, "base_fee": None, "tips": {}, "suggested_tip": None}
+        if not isinstance(max_priority, Exception):
+            sample["suggested_tip"] = max_priority
+        if not isinstance(history, Exception) and history.get("baseFeePerGas"):
+            # The last entry is the base fee of the next block
+            sample["base_fee"] = history["baseFeePerGas"][-1]
+            rewards = history.get("reward") or []
+            for i, (speed, _) in enumerate(sorted(SPEEDS.items(), key=lambda item: item[1])):
+                # Empty blocks report a zero reward and say nothing about the going rate
+                paid = [r[i] for r in rewards if len(r) > i and r[i] > 0]
+                sample["tips"][speed] = int(statistics.median(paid)) if paid else 0
+        with self._lock:
+            self._sample = sample
+            self._sampled_at = time.monotonic()
+        return sample
+
+    def _run(self):
+        while not self._stopping.wait(self.refresh_interval):
+            try:
+                self._fetch()
+            except Exception as e:
+                print(f"Error sampling fees on {self.chain}: {e}")
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopping.set()
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    def sample(self):
+        """
+            Returns the latest sample, fetching one first if it is missing or older than ttl
+        """
+        self.start()
+        with self._lock:
+            sample, fresh = self._sample, time.monotonic() - self._sampled_at <= self.ttl
+        if sample is None or not fresh:
+            sample = self._fetch()
+        return sample
+
+    def fees(self, speed="standard", legacy=None):
+        """
+            Returns the fee fields for a transaction that should be included at speed
+            ("slow", "standard" or "fast"): {"maxFeePerGas", "maxPriorityFeePerGas"} for a type-2
+            transaction, or {"gasPrice"} for a legacy one.
+            legacy - force one kind; by default type-2 is used wherever the chain has a base fee.
+            maxFeePerGas allows twice the next base fee, so a transaction stays includable through
+            several consecutive full blocks while fees spike.
+        """
+        if speed not in SPEEDS:
+            raise ValueError(f"Unknown speed {speed}")
+        sample = self.sample()
+        base_fee = sample["base_fee"]
+        # The node's own suggestion only when recent blocks paid no tips to go by
+        tip = sample["tips"].get(speed) or sample["suggested_tip"] or 0
+        if legacy or not base_fee:
+            # Never bid under what the node itself suggests
+            price = sample["gas_price"] if base_fee is None else max(base_fee + tip, sample["gas_price"])
+            return {"gasPrice": price}
+        return {"maxFeePerGas": 2 * base_fee + tip, "maxPriorityFeePerGas": tip}
+
+
+def get_oracle(w3, chain, **kwargs):
+    """
+        Returns the process-wide FeeOracle for chain, creating it on first use
+    """
+    with _oracles_lock:
+        oracle = _oracles.get(chain)
+        if oracle is None or oracle.w3 is not w3:
+            if oracle is not None:
+                # Its sampler would otherwise keep polling the old endpoint for good
+                oracle.stop()
+            oracle = FeeOracle(w3, chain, **kwargs)
+            _oracles[chain] = oracle
+        return oracle
+
+
+def stop_oracles():
+    """
+        Stops every process-wide FeeOracle's sampler, so the next get_oracle starts a fresh one
+    """
+    with _oracles_lock:
+        oracles = list(_oracles.values())
+        _oracles.clear()
+    for oracle in oracles:
+        oracle.stop()
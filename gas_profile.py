@@ -0,0 +1,237 @@
+import math
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from web3.exceptions import TransactionNotFound
+from rpc_batch import batch_call
+from nonce_manager import nonce_replaced
+
+
+DEFAULT_GAS_DB = Path(__file__).parent.absolute() / "gas_profiles.db"
+
+# Gas limit used when a call has no profile and the node cannot estimate it
+FALLBACK_GAS = 300000
+
+# Safety margin over the highest gasUsed seen: a new profile starts at DEFAULT_MARGIN, shrinks
+# towards MIN_MARGIN while receipts stay under the known maximum, and grows when they do not
+DEFAULT_MARGIN = 0.2
+MIN_MARGIN = 0.05
+MAX_MARGIN = 1.0
+
+# Gas always allowed above the highest gasUsed seen: a relay whose mint or transfer writes a storage
+# slot that was zero (e.g. a recipient with no balance yet) costs about 22,100 more than one that does not
+MIN_HEADROOM = 25000
+
+# Settles a tracked transaction may go unknown to the node before settle() checks whether its nonce
+# was taken by another transaction
+MAX_SETTLE_ATTEMPTS = 20
+
+
+def _hex_key(value):
+    """
+        Returns value (address bytes, hex string or None) as a lowercase 0x-prefixed string, or ""
+    """
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.lower()
+    return "0x" + bytes(value).hex()
+
+
+def profile_key(chain, tx, token=None):
+    """
+        Returns the (chain, contract, selector, token) profile key for a built transaction
+    """
+    data = tx.get("data") or tx.get("input") or "0x"
+    data = data if isinstance(data, str) else "0x" + bytes(data).hex()
+    return chain, _hex_key(tx.get("to")), data[:10].lower(), _hex_key(token)
+
+
+class GasProfiles:
+    """
+        Learned gas limits per (chain, contract, function selector, token), kept in a local
+        SQLite file and mirrored in memory so a lookup costs no RPC round trip.
+        Profiles are seeded from the gasUsed of mined receipts. The limit handed out is the highest
+        gasUsed seen plus a margin that is learned from how much later receipts exceed it, and
+        never less than MIN_HEADROOM above it.
+        Calls with no profile yet fall back to a live estimate_gas.
+    """
+
+    def __init__(self, db_path=DEFAULT_GAS_DB):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS gas_profile ("
+                " chain TEXT NOT NULL, contract TEXT NOT NULL, selector TEXT NOT NULL, token TEXT NOT NULL,"
+                " samples INTEGER NOT NULL, max_used INTEGER NOT NULL, margin REAL NOT NULL,"
+                " PRIMARY KEY (chain, contract, selector, token))"
+            )
+            # Sent transactions whose receipts have not been folded into a profile yet
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS gas_pending ("
+                " chain TEXT NOT NULL, tx_hash TEXT NOT NULL,"
+                " contract TEXT NOT NULL, selector TEXT NOT NULL, token TEXT NOT NULL, gas_limit INTEGER NOT NULL,"
+                " attempts INTEGER NOT NULL DEFAULT 0, sender TEXT NOT NULL DEFAULT '', nonce INTEGER,"
+                " PRIMARY KEY (chain, tx_hash))"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(gas_pending)")}
+            if "sender" not in columns:
+                # Rows from before the sender was kept cannot be checked for replacement
+                conn.execute("ALTER TABLE gas_pending ADD COLUMN sender TEXT NOT NULL DEFAULT ''")
+                conn.execute("ALTER TABLE gas_pending ADD COLUMN nonce INTEGER")
+            rows = conn.execute("SELECT chain, contract, selector, token, samples, max_used, margin FROM gas_profile")
+            self._profiles = {tuple(row[:4]): [row[4], row[5], row[6]] for row in rows}
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def limit(self, key):
+        """
+            Returns the learned gas limit for profile key, or None if it has no samples yet
+        """
+        with self._lock:
+            profile = self._profiles.get(key)
+        if profile is None:
+            return None
+        _, max_used, margin = profile
+        return max(math.ceil(max_used * (1 + margin)), max_used + MIN_HEADROOM)
+
+    def gas_limit(self, w3, chain, tx, token=None):
+        """
+            Returns the gas limit to send tx with: the learned limit, or on a miss a live estimate
+            plus DEFAULT_MARGIN, or FALLBACK_GAS if the node cannot estimate it
+        """
+        learned = self.limit(profile_key(chain, tx, token))
+        if learned is not None:
+            return learned
+        estimate_tx = {k: v for k, v in tx.items() if k != "gas"}
+        try:
+            return math.ceil(w3.eth.estimate_gas(estimate_tx) * (1 + DEFAULT_MARGIN))
+        except Exception:
+            return FALLBACK_GAS
+
+    def observe(self, key, gas_used, gas_limit=None, status=1):
+        """
+            Folds one mined transaction into the profile for key.
+            A failed transaction that used (nearly) its whole limit ran out of gas, which widens the margin.
+        """
+        with self._lock:
+            samples, max_used, margin = self._profiles.get(key, [0, 0, DEFAULT_MARGIN])
+            if not status and gas_limit and gas_used >= gas_limit * 0.98:
+                margin = min(margin * 2 + 0.1, MAX_MARGIN)
+                max_used = max(max_used, gas_limit)
+            elif not status:
+                # Reverted for another reason; its gasUsed says nothing about a successful call
+                return
+            elif samples and gas_used > max_used:
+                overshoot = gas_used / max_used - 1
+                margin = min(max(margin, 2 * overshoot + MIN_MARGIN), MAX_MARGIN)
+                max_used = gas_used
+                samples += 1
+            else:
+                if samples:
+                    margin = max(margin * 0.9, MIN_MARGIN)
+                max_used = max(max_used, gas_used)
+                samples += 1
+            self._profiles[key] = [samples, max_used, margin]
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO gas_profile (chain, contract, selector, token, samples, max_used, margin)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?)", key + (samples, max_used, margin)
+                )
+
+    def observe_receipt(self, chain, tx, receipt, token=None):
+        self.observe(profile_key(chain, tx, token), receipt["gasUsed"], tx.get("gas"), receipt.get("status", 1))
+
+    def track(self, chain, tx_hash, tx, token=None):
+        """
+            Remembers a sent transaction so settle() can learn from its receipt once it is mined
+        """
+        key = profile_key(chain, tx, token)
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO gas_pending"
+                " (chain, tx_hash, contract, selector, token, gas_limit, sender, nonce) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chain, _hex_key(tx_hash)) + key[1:] + (int(tx.get("gas", 0)), tx.get("from") or "", tx.get("nonce"))
+            )
+
+    def settle_receipt(self, chain, tx_hash, receipt):
+        """
+            Learns from the receipt of one tracked transaction, e.g. as a ConfirmationTracker sees it
+            mined, and stops tracking it. Returns False if tx_hash was not tracked or already settled.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT contract, selector, token, gas_limit FROM gas_pending WHERE chain = ? AND tx_hash = ?",
+                (chain, _hex_key(tx_hash))
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM gas_pending WHERE chain = ? AND tx_hash = ?", (chain, _hex_key(tx_hash)))
+        self.observe((chain,) + tuple(row[:3]), receipt["gasUsed"], row[3], receipt.get("status", 1))
+        return True
+
+    def settle(self, w3, chain, on_failed=None):
+        """
+            Fetches receipts for the tracked transactions on chain in one batch and learns from
+            every one that has been mined. Returns the number settled.
+            Only a receipt the node reports as not found counts as an attempt; a failed fetch is
+            retried on the next settle. After MAX_SETTLE_ATTEMPTS the transaction is dropped only
+            if nonce_replaced shows another transaction used its nonce.
+            on_failed - optional callable (tx_hash hex string) run for each tracked transaction that
+                        reverted or was replaced
+        """
+        with self._lock, self._connect() as conn:
+            pending = conn.execute(
+                "SELECT tx_hash, contract, selector, token, gas_limit, attempts, sender, nonce"
+                " FROM gas_pending WHERE chain = ?", (chain,)
+            ).fetchall()
+        if not pending:
+            return 0
+        receipts = batch_call(
+            w3, [lambda h=row[0]: w3.eth.get_transaction_receipt(h) for row in pending], return_exceptions=True
+        )
+        settled = []
+        waiting = []
+        dropped = []
+        failed = []
+        for (tx_hash, contract, selector, token, gas_limit, attempts, sender, nonce), receipt in zip(pending, receipts):
+            if receipt is None or isinstance(receipt, TransactionNotFound):
+                # In the mempool, dropped or replaced
+                waiting.append((chain, tx_hash))
+                if attempts + 1 < MAX_SETTLE_ATTEMPTS:
+                    continue
+                if not sender or nonce is None:
+                    # Tracked before senders were kept; stop waiting, but it may still be mined
+                    dropped.append((chain, tx_hash))
+                    continue
+                try:
+                    if nonce_replaced(w3, sender, nonce, tx_hash):
+                        dropped.append((chain, tx_hash))
+                        failed.append(tx_hash)
+                except Exception as e:
+                    print(f"Error checking whether {tx_hash} was replaced: {e}")
+                continue
+            if isinstance(receipt, Exception):
+                # Transport error; the next settle asks again
+                continue
+            status = receipt.get("status", 1)
+            self.observe((chain, contract, selector, token), receipt["gasUsed"], gas_limit, status)
+            settled.append((chain, tx_hash))
+            if not status:
+                failed.append(tx_hash)
+        with self._lock, self._connect() as conn:
+            conn.executemany("DELETE FROM gas_pending WHERE chain = ? AND tx_hash = ?", settled + dropped)
+            conn.executemany("UPDATE gas_pending SET attempts = attempts + 1 WHERE chain = ? AND tx_hash = ?", waiting)
+        if on_failed is not None:
+            for tx_hash in failed:
+                on_failed(tx_hash)
+        return len(settled)
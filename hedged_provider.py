@@ -0,0 +1,221 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import requests
+from web3.providers.base import JSONBaseProvider
+
+
+# Methods that change chain state are never duplicated, only failed over
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+# Reads whose answer depends on what one node has seen of our own transactions (the pending nonce,
+# receipts, a transaction still in its mempool). They go to the endpoint that accepted our last write,
+# never hedged, so a count and the receipts fetched after it come from the same node
+STATE_METHODS = {"eth_getTransactionCount", "eth_getTransactionReceipt", "eth_getTransactionByHash"}
+
+
+class EndpointStats:
+    """
+        Rolling latency and error record for one RPC endpoint
+    """
+
+    def __init__(self, url, window=200):
+        self.url = url
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.consecutive_errors = 0
+        self.down_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency, ok, cooldown):
+        with self._lock:
+            self.outcomes.append(ok)
+            if ok:
+                self.latencies.append(latency)
+                self.consecutive_errors = 0
+            else:
+                self.consecutive_errors += 1
+                # Back off exponentially from an endpoint that keeps failing
+                if self.consecutive_errors >= 3:
+                    self.down_until = time.monotonic() + cooldown * 2 ** min(self.consecutive_errors - 3, 5)
+
+    def percentile(self, q):
+        """
+            Returns the q-th quantile (0..1) of recent successful latencies, or None with no samples
+        """
+        with self._lock:
+            if not self.latencies:
+                return None
+            ordered = sorted(self.latencies)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+    def error_rate(self):
+        with self._lock:
+            if not self.outcomes:
+                return 0.0
+            return self.outcomes.count(False) / len(self.outcomes)
+
+    def healthy(self, max_error_rate):
+        return time.monotonic() >= self.down_until and self.error_rate() <= max_error_rate
+
+
+class HedgedHTTPProvider(JSONBaseProvider):
+    """
+        JSON-RPC provider over several HTTP endpoints for the same chain.
+        Reads go to the healthy endpoint with the lowest rolling p50 latency; if it has not answered
+        once its hedge_percentile latency has passed, a duplicate request goes to the next endpoint
+        and the first answer wins. Writes are sent to one endpoint at a time and only fail over on
+        transport errors. Reads in STATE_METHODS are pinned to the endpoint that accepted the last
+        write (or that answered the last such read) and only fail over, and re-pin, on errors.
+        Endpoints with a high error rate or repeated failures are skipped until their cooldown ends.
+    """
+
+    def __init__(self, endpoint_uris, session=None, request_timeout=30, hedge_percentile=0.9,
+                 min_hedge_delay=0.05, default_hedge_delay=0.5, max_error_rate=0.5, cooldown=15,
+                 window=200, max_workers=16, **kwargs):
+        super().__init__(**kwargs)
+        if not endpoint_uris:
+            raise ValueError("HedgedHTTPProvider needs at least one endpoint")
+        self.endpoints = [EndpointStats(url, window) for url in endpoint_uris]
+        # Identifies the endpoint group to code that keys per-endpoint state by endpoint_uri
+        self.endpoint_uri = " | ".join(endpoint_uris)
+        self.session = session if session is not None else requests.Session()
+        self.request_timeout = request_timeout
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_hedge_delay = default_hedge_delay
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._pinned = None
+        self._pin_lock = threading.Lock()
+
+    def __str__(self):
+        return f"HedgedHTTPProvider({self.endpoint_uri})"
+
+    def ranked_endpoints(self):
+        """
+            Returns healthy endpoints fastest first, then unhealthy ones as a last resort.
+            An endpoint with no samples yet ranks first so it gets measured.
+        """
+        def p50(stats):
+            value = stats.percentile(0.5)
+            return 0.0 if value is None else value
+        healthy = [e for e in self.endpoints if e.healthy(self.max_error_rate)]
+        unhealthy = [e for e in self.endpoints if e not in healthy]
+        return sorted(healthy, key=p50) + sorted(unhealthy, key=lambda e: e.down_until)
+
+    def hedge_delay(self, stats):
+        delay = stats.percentile(self.hedge_percentile)
+        if delay is None:
+            return self.default_hedge_delay
+        return max(delay, self.min_hedge_delay)
+
+    def stats_snapshot(self):
+        """
+            Returns {url: {"p50", "p99", "error_rate", "healthy"}} for every endpoint
+        """
+        return {
+            e.url: {
+                "p50": e.percentile(0.5),
+                "p99": e.percentile(0.99),
+                "error_rate": e.error_rate(),
+                "healthy": e.healthy(self.max_error_rate),
+            }
+            for e in self.endpoints
+        }
+
+    def _post(self, stats, request_data):
+        start = time.monotonic()
+        try:
+            response = self.session.post(
+                stats.url, data=request_data, headers={"Content-Type": "application/json"},
+                timeout=self.request_timeout
+            )
+            response.raise_for_status()
+        except Exception:
+            stats.record(time.monotonic() - start, False, self.cooldown)
+            raise
+        stats.record(time.monotonic() - start, True, self.cooldown)
+        return response.content
+
+    def _send_one(self, endpoints, request_data):
+        """
+            Sends request_data to endpoints in turn until one answers, and pins that endpoint
+        """
+        error = None
+        for stats in endpoints:
+            try:
+                content = self._post(stats, request_data)
+            except Exception as e:
+                error = e
+                continue
+            with self._pin_lock:
+                self._pinned = stats
+            return content
+        raise error
+
+    def _send_write(self, request_data):
+        return self._send_one(self.ranked_endpoints(), request_data)
+
+    def _send_pinned(self, request_data):
+        ranked = self.ranked_endpoints()
+        with self._pin_lock:
+            pinned = self._pinned
+        if pinned is not None and pinned.healthy(self.max_error_rate):
+            ranked = [pinned] + [e for e in ranked if e is not pinned]
+        return self._send_one(ranked, request_data)
+
+    def _send_read(self, request_data):
+        ranked = self.ranked_endpoints()
+        pending = {}
+        error = None
+        next_index = 0
+
+        def launch():
+            nonlocal next_index
+            stats = ranked[next_index]
+            next_index += 1
+            pending[self._executor.submit(self._post, stats, request_data)] = stats
+            return stats
+
+        primary = launch()
+        delay = self.hedge_delay(primary)
+        while pending:
+            done, _ = wait(list(pending), timeout=delay, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            # Hedge when the request in flight is slow, or retry elsewhere when every request failed
+            if next_index < len(ranked) and (not done or not pending):
+                delay = self.hedge_delay(launch())
+            elif not pending:
+                break
+            else:
+                delay = None
+        raise error
+
+    def _send(self, method, request_data):
+        if method in WRITE_METHODS:
+            return self._send_write(request_data)
+        if method in STATE_METHODS:
+            return self._send_pinned(request_data)
+        return self._send_read(request_data)
+
+    def make_request(self, method, params):
+        request_data = self.encode_rpc_request(method, params)
+        return self.decode_rpc_response(self._send(method, request_data))
+
+    def make_batch_request(self, batch_requests):
+        request_data = self.encode_batch_rpc_request(batch_requests)
+        methods = {method for method, _ in batch_requests}
+        method = next(iter(methods & WRITE_METHODS), next(iter(methods & STATE_METHODS), "batch"))
+        response = self.decode_rpc_response(self._send(method, request_data))
+        if not isinstance(response, list):
+            # RPC errors return only one response with the error object
+            return response
+        return sorted(response, key=lambda r: r.get("id") if isinstance(r.get("id"), int) else 0)
@@ -0,0 +1,132 @@
+from merkle_builder import hash_level, keccak, pack_leaves
+
+
+class _LevelView:
+    """
+        Read-only list-like view of one packed level, so prove_merkle can walk the tree
+    """
+
+    def __init__(self, level):
+        self._level = level
+
+    def __len__(self):
+        return len(self._level) // 32
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("node index out of range")
+        return bytes(self._level[32 * index:32 * index + 32])
+
+
+class IncrementalMerkleTree:
+    """
+        A Merkle tree that can grow and change without being rebuilt.
+        It is the tree build_merkle would build over the same leaves: pairs are hashed sorted, as
+        hash_pair does for OpenZeppelin's MerkleProof, and a level with an odd node count is hashed
+        as if its last node were repeated. Appending or updating leaves rehashes only the parents of
+        the changed nodes, so one leaf costs O(log n) hashes and proofs from prove_merkle(tree, index)
+        or proof() match the new root straight away.
+        Each level is kept as a packed bytearray of 32-byte nodes.
+    """
+
+    def __init__(self, leaves=()):
+        self._levels = [bytearray()]
+        self.extend(leaves)
+
+    @classmethod
+    def from_levels(cls, levels):
+        """
+            Adopts a tree that was already built: packed levels from build_levels, or a MappedTree
+        """
+        tree = cls()
+        tree._levels = [
+            bytearray(level.buffer() if hasattr(level, "buffer") else level) for level in levels
+        ] or [bytearray()]
+        return tree
+
+    @property
+    def leaf_count(self):
+        return len(self._levels[0]) // 32
+
+    @property
+    def root(self):
+        return bytes(self._levels[-1][:32])
+
+    def packed_levels(self):
+        """
+            Returns the levels as bytes, in the form MappedTree.write stores
+        """
+        return [bytes(level) for level in self._levels]
+
+    def append(self, leaf):
+        """
+            Adds leaf (bytes32) after the last leaf and returns its index
+        """
+        index = self.leaf_count
+        self._levels[0] += bytes(leaf)
+        self._rehash(index, index + 1)
+        return index
+
+    def extend(self, leaves):
+        """
+            Adds leaves (as merkle_builder.pack_leaves accepts them) after the last leaf;
+            each level's new parents are hashed together
+        """
+        packed = pack_leaves(leaves)
+        if not packed:
+            return
+        start = self.leaf_count
+        self._levels[0] += packed
+        self._rehash(start, self.leaf_count)
+
+    def update(self, index, leaf):
+        """
+            Replaces leaf index with leaf (bytes32)
+        """
+        if not 0 <= index < self.leaf_count:
+            raise IndexError("leaf index out of range")
+        self._levels[0][32 * index:32 * index + 32] = bytes(leaf)
+        self._rehash(index, index + 1)
+
+    def _rehash(self, lo, hi):
+        """
+            Recomputes every ancestor of nodes lo..hi-1 of the leaf level
+        """
+        level = 0
+        while len(self._levels[level]) > 32:
+            if level + 1 == len(self._levels):
+                self._levels.append(bytearray())
+            nodes = self._levels[level]
+            lo, hi = lo // 2, (hi + 1) // 2
+            children = bytes(nodes[64 * lo:64 * hi])
+            if len(children) < 64 * (hi - lo):
+                children += children[-32:]
+            if hi - lo == 1:
+                a, b = children[:32], children[32:]
+                parents = keccak(a + b if a < b else b + a)
+            else:
+                parents = hash_level(children)
+            self._levels[level + 1][32 * lo:32 * hi] = parents
+            level += 1
+
+    def proof(self, index):
+        """
+            Returns the proof of inclusion for leaf index, as prove_merkle does
+        """
+        if not 0 <= index < self.leaf_count:
+            raise IndexError("leaf index out of range")
+        proof = []
+        for level in self._levels[:-1]:
+            count = len(level) // 32
+            sibling = min(index ^ 1, count - 1)
+            proof.append(bytes(level[32 * sibling:32 * sibling + 32]))
+            index //= 2
+        return proof
+
+    def __len__(self):
+        return len(self._levels)
+
+    def __getitem__(self, level):
+        return _LevelView(self._levels[level])
@@ -1,10 +1,11 @@
 from web3 import Web3
-from web3.providers.rpc import HTTPProvider
-from web3.middleware import ExtraDataToPOAMiddleware #Necessary for POA chains
+import providers
 from pathlib import Path
 import json
 from datetime import datetime
 import pandas as pd
+from event_decoder import EventRegistry, LogQuery
+from log_fetcher import LogFetcher
 
 
 def scan_blocks(chain, start_block, end_block, contract_address, eventfile='deposit_logs.csv'):
@@ -17,23 +18,13 @@ def scan_blocks(chain, start_block, end_block, contract_address, eventfile='depo
 	This function reads "Deposit" events from the specified contract, 
 	and writes information about the events to the file "deposit_logs.csv"
     """
-    if chain == 'avax':
-        api_url = f"https://api.avax-test.network/ext/bc/C/rpc" #AVAX C-chain testnet
-
-    if chain == 'bsc':
-        api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/" #BSC testnet
-
-    if chain in ['avax','bsc']:
-        w3 = Web3(Web3.HTTPProvider(api_url))
-        # inject the poa compatibility middleware to the innermost layer
-        w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-    else:
-        w3 = Web3(Web3.HTTPProvider(api_url))
+    # Shared, cached instance; the POA middleware is injected for avax and bsc
+    w3 = providers.get_web3(chain)
 
     DEPOSIT_ABI = json.loads('[ { "anonymous": false, "inputs": [ { "indexed": true, "internalType": "address", "name": "token", "type": "address" }, { "indexed": true, "internalType": "address", "name": "recipient", "type": "address" }, { "indexed": false, "internalType": "uint256", "name": "amount", "type": "uint256" } ], "name": "Deposit", "type": "event" }]')
-    contract = w3.eth.contract(address=contract_address, abi=DEPOSIT_ABI)
-
-    arg_filter = {}
+    contract_address = Web3.to_checksum_address(contract_address)
+    # Raw logs are matched on address and topic, then decoded straight into compact DepositRecords
+    deposits = LogQuery(w3, EventRegistry(contract_address, DEPOSIT_ABI), "Deposit")
 
     if start_block == "latest":
         start_block = w3.eth.get_block_number()
@@ -50,51 +41,19 @@ def scan_blocks(chain, start_block, end_block, contract_address, eventfile='depo
     else:
         print( f"Scanning blocks {start_block} - {end_block} on {chain}" )
 
-    if end_block - start_block < 30:
-        event_filter = contract.events.Deposit.create_filter(from_block=start_block,to_block=end_block,argument_filters=arg_filter)
-        events = event_filter.get_all_entries()
-        #print( f"Got {len(events)} entries for block {block_num}" )
-        # TODO YOUR CODE HERE
+    # Ranges the RPC rejects are bisected, so any range is fetched in as few calls as the node allows
+    events = LogFetcher(w3).get_logs(deposits, start_block, end_block)
+    #print( f"Got {len(events)} entries" )
+    if not events:
+        return
+
+    file_path = Path(eventfile)
+    write_header = not file_path.exists()
+    with file_path.open('a') as f:
+        if write_header:
+            # write CSV header once
+            f.write('chain,token,recipient,amount,transactionHash,address\n')
         for evt in events:
-            data = {
-                'chain': chain,
-                'token': evt.args['token'],
-                'recipient': evt.args['recipient'],
-                'amount': evt.args['amount'],
-                'transactionHash': evt.transactionHash.hex(),
-                'address': evt.address,
-            }
-
-            file_path = Path(eventfile)
-            write_header = not file_path.exists()
-
-            with file_path.open('a') as f:
-                if write_header:
-                    # write CSV header once
-                    f.write('chain,token,recipient,amount,transactionHash,address\n')
-                line = f"{data['chain']},{data['token']},{data['recipient']},{data['amount']},{data['transactionHash']},{data['address']}\n"
-                f.write(line)
-    else:
-        for block_num in range(start_block,end_block+1):
-            event_filter = contract.events.Deposit.create_filter(from_block=block_num,to_block=block_num,argument_filters=arg_filter)
-            events = event_filter.get_all_entries()
-            #print( f"Got {len(events)} entries for block {block_num}" )
-            # TODO YOUR CODE HERE
-            for evt in events:
-                data = {
-                    'chain': chain,
-                    'token': evt.args['token'],
-                    'recipient': evt.args['recipient'],
-                    'amount': evt.args['amount'],
-                    'transactionHash': evt.transactionHash.hex(),
-                    'address': evt.address,
-                }
-
-                file_path = Path(eventfile)
-                write_header = not file_path.exists()
-
-                with file_path.open('a') as f:
-                    if write_header:
-                        f.write('chain,token,recipient,amount,transactionHash,address\n')
-                    line = f"{data['chain']},{data['token']},{data['recipient']},{data['amount']},{data['transactionHash']},{data['address']}\n"
-                    f.write(line)
+            token = Web3.to_checksum_address(evt.token)
+            recipient = Web3.to_checksum_address(evt.recipient)
+            f.write(f"{chain},{token},{recipient},{evt.amount},{evt.tx_hash.hex()},{contract_address}\n")
@@ -0,0 +1,229 @@
+import asyncio
+import threading
+import time
+import aiohttp
+import requests
+
+
+# Largest block span each RPC endpoint has answered, and the smallest span it has rejected,
+# shared by every LogFetcher in the process so later scans start from what we already learned
+_accepted_spans = {}
+_rejected_spans = {}
+# Consecutive full-span requests each endpoint has answered since its span last changed, and the
+# span it had before it last grew
+_success_streaks = {}
+_previous_spans = {}
+_spans_lock = threading.Lock()
+
+# Full-span successes after which an endpoint's span grows toward its smallest rejected span, and
+# after which a span already just below it probes past it
+GROW_AFTER = 8
+PROBE_AFTER = 64
+
+# Times a request that failed for another reason than its range is retried before the error is raised
+TRANSIENT_RETRIES = 2
+RETRY_DELAY = 0.5
+# Rate-limited requests back off for longer, and more times, before the error is raised
+RATE_LIMIT_RETRIES = 4
+RATE_LIMIT_DELAY = 1.0
+
+# Lower-cased fragments of the errors nodes return for a range that is too wide or matches too many logs.
+# Only range and result-count wording: bare "exceed", "too many" or code -32005 also match rate limits
+_RANGE_ERROR_MARKERS = (
+    "block range", "blocks range", "range limit", "range is too", "range too", "is limited to a",
+    "returned more than", "too many results", "too many logs", "response size", "query timeout",
+)
+
+# Lower-cased fragments of rate-limit errors, which say nothing about the span even when they also
+# contain a range marker
+_RATE_LIMIT_MARKERS = (
+    "rate limit", "rate-limit", "request rate", "too many requests", "request count", "requests per", "throttl",
+    "compute units", "capacity",
+)
+
+_TRANSPORT_ERRORS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError, ConnectionError,
+                     TimeoutError)
+
+
+def _error_text(error):
+    return " ".join(str(arg) for arg in (error, *error.args)).lower()
+
+
+def is_rate_limited(error):
+    """
+        Returns True if error is the node or provider throttling us (rate limit, request quota)
+    """
+    return any(marker in _error_text(error) for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_range_rejection(error):
+    """
+        Returns True if error is the node refusing an eth_getLogs range (block range limit, too many
+        results, query timeout), as opposed to a rate limit, transport or other failure that says
+        nothing about the span
+    """
+    if isinstance(error, _TRANSPORT_ERRORS) or is_rate_limited(error):
+        return False
+    message = _error_text(error)
+    return any(marker in message for marker in _RANGE_ERROR_MARKERS)
+
+
+def _retry_delay(error, attempt):
+    """
+        Returns the seconds to wait before retrying a request that failed with error for reasons other
+        than its range, or None once it has been retried enough
+    """
+    if is_rate_limited(error):
+        return RATE_LIMIT_DELAY * 2 ** attempt if attempt < RATE_LIMIT_RETRIES else None
+    return RETRY_DELAY * 2 ** attempt if attempt < TRANSIENT_RETRIES else None
+
+
+def reset_spans():
+    """
+        Forgets the spans learned for every endpoint, so the next request goes out unchunked
+    """
+    with _spans_lock:
+        for table in (_accepted_spans, _rejected_spans, _success_streaks, _previous_spans):
+            table.clear()
+
+
+def endpoint_key(w3):
+    """
+        Returns a string identifying the RPC endpoint behind a web3 instance
+    """
+    provider = w3.provider
+    return str(getattr(provider, "endpoint_uri", None) or repr(provider))
+
+
+class LogFetcher:
+    """
+        Fetches event logs over a block range, recursively bisecting the range whenever the
+        RPC rejects it (too many results, query timeout, block range limit).
+        The largest span each endpoint accepts is remembered and used to chunk later requests, and
+        grown again after GROW_AFTER requests in a row succeed at it. Other errors (timeouts,
+        dropped connections) are retried TRANSIENT_RETRIES times without bisecting, then raised;
+        rate limits are retried RATE_LIMIT_RETRIES times with a longer backoff.
+
+        block_fallback - optional callable (block_num) -> list of events, used as a last resort
+                         when the RPC rejects even a single block
+    """
+
+    def __init__(self, w3, block_fallback=None):
+        self.w3 = w3
+        self.endpoint = endpoint_key(w3)
+        self.block_fallback = block_fallback
+
+    def max_span(self):
+        """
+            Returns the span to request in one call, or None if the endpoint has never
+            rejected a range
+        """
+        with _spans_lock:
+            if self.endpoint not in _rejected_spans:
+                return None
+            return max(_accepted_spans.get(self.endpoint, 1), 1)
+
+    def _record_success(self, span):
+        with _spans_lock:
+            accepted = _accepted_spans.get(self.endpoint, 0)
+            if span > accepted:
+                _accepted_spans[self.endpoint] = accepted = span
+            rejected = _rejected_spans.get(self.endpoint)
+            if rejected is None or span < accepted:
+                return
+            streak = _success_streaks.get(self.endpoint, 0) + 1
+            _success_streaks[self.endpoint] = streak
+            if accepted < rejected - 1 and streak >= GROW_AFTER:
+                # Double, or halve the gap when doubling would reach the smallest rejected span
+                grown = min(accepted * 2, (accepted + rejected) // 2)
+            elif accepted >= rejected - 1 and streak >= PROBE_AFTER:
+                # Just below the smallest rejected span: now and then probe past it, as a too-many-results
+                # rejection only says that one range was busy
+                grown = accepted * 2
+                _rejected_spans[self.endpoint] = grown + 1
+            else:
+                return
+            _success_streaks[self.endpoint] = 0
+            _previous_spans[self.endpoint] = accepted
+            _accepted_spans[self.endpoint] = grown
+
+    def _record_failure(self, span):
+        with _spans_lock:
+            _success_streaks[self.endpoint] = 0
+            if span < _rejected_spans.get(self.endpoint, span + 1):
+                _rejected_spans[self.endpoint] = span
+            # A span that has just been rejected can no longer be treated as accepted
+            if _accepted_spans.get(self.endpoint, 0) >= span:
+                previous = _previous_spans.pop(self.endpoint, 0)
+                _accepted_spans[self.endpoint] = previous if 0 < previous < span else max(span // 2, 1)
+
+    def get_logs(self, event, from_block, to_block):
+        """
+            event - a contract event class, e.g. contract.events.Unwrap, or an event_decoder.LogQuery
+            Returns the decoded events in [from_block, to_block], in block order
+        """
+        events = []
+        start = from_block
+        while start <= to_block:
+            # Re-read every window, so what the last request taught takes effect at once
+            span = self.max_span()
+            end = to_block if span is None else min(start + span - 1, to_block)
+            events.extend(self._fetch(event, start, end))
+            start = end + 1
+        return events
+
+    def _fetch(self, event, from_block, to_block, attempt=0):
+        span = to_block - from_block + 1
+        try:
+            events = event().get_logs(from_block=from_block, to_block=to_block)
+        except Exception as e:
+            if not is_range_rejection(e):
+                delay = _retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                return self._fetch(event, from_block, to_block, attempt + 1)
+            if span == 1:
+                if self.block_fallback is None:
+                    raise
+                print(f"  Log fetch for block {from_block} failed: {e}. Falling back to receipt scan.")
+                return self.block_fallback(from_block)
+            self._record_failure(span)
+            mid = from_block + span // 2
+            return self._fetch(event, from_block, mid - 1) + self._fetch(event, mid, to_block)
+        self._record_success(span)
+        return list(events)
+
+    async def get_logs_async(self, event, from_block, to_block):
+        """
+            Same as get_logs() for an AsyncWeb3 contract event.
+            The receipt fallback is not used here; a single rejected block raises.
+        """
+        events = []
+        start = from_block
+        while start <= to_block:
+            # Re-read every window, so what the last request taught takes effect at once
+            span = self.max_span()
+            end = to_block if span is None else min(start + span - 1, to_block)
+            events.extend(await self._fetch_async(event, start, end))
+            start = end + 1
+        return events
+
+    async def _fetch_async(self, event, from_block, to_block, attempt=0):
+        span = to_block - from_block + 1
+        try:
+            events = await event().get_logs(from_block=from_block, to_block=to_block)
+        except Exception as e:
+            if not is_range_rejection(e):
+                delay = _retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                return await self._fetch_async(event, from_block, to_block, attempt + 1)
+            if span == 1:
+                raise
+            self._record_failure(span)
+            mid = from_block + span // 2
+            return await self._fetch_async(event, from_block, mid - 1) + await self._fetch_async(event, mid, to_block)
+        self._record_success(span)
+        return list(events)
@@ -0,0 +1,108 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+try:
+    # safe-pysha3 hashes a 64-byte pair about five times faster than pycryptodome
+    from sha3 import keccak_256 as _new_keccak
+except ImportError:
+    from Crypto.Hash import keccak as _crypto_keccak
+
+    def _new_keccak(data):
+        return _crypto_keccak.new(digest_bits=256, data=data)
+
+
+def keccak(data):
+    return _new_keccak(data).digest()
+
+
+# Levels with at least this many pairs are hashed by the process pool when there is more than one worker
+POOL_MIN_PAIRS = 1 << 15
+
+
+def pack_leaves(leaves):
+    """
+        Returns leaves as one contiguous buffer of 32-byte nodes.
+        leaves - a list of bytes32 values, or an array of unsigned ints (e.g. from
+                 prime_sieve.first_primes) that are encoded big-endian as convert_leaves does
+    """
+    if isinstance(leaves, np.ndarray):
+        nodes = np.zeros((len(leaves), 4), dtype=">u8")
+        nodes[:, 3] = leaves
+        return nodes.tobytes()
+    return b"".join(bytes(leaf) for leaf in leaves)
+
+
+def _sort_pairs(level):
+    """
+        Returns level (an even number of 32-byte nodes) with the two nodes of every pair in
+        ascending byte order, as hash_pair orders them
+    """
+    nodes = np.frombuffer(level, dtype=np.uint8).reshape(-1, 2, 32)
+    left, right = nodes[:, 0], nodes[:, 1]
+    # Byte order is decided by the first byte that differs; equal pairs stay as they are
+    first_diff = (left != right).argmax(axis=1)
+    rows = np.arange(len(nodes))
+    swap = left[rows, first_diff] > right[rows, first_diff]
+    if not swap.any():
+        return level
+    ordered = nodes.copy()
+    ordered[swap] = nodes[swap][:, ::-1]
+    return ordered.tobytes()
+
+
+def hash_level(level):
+    """
+        Returns the parent level of level, a buffer of an even number of 32-byte nodes: the keccak256
+        of each sorted 64-byte pair, packed the same way.
+        Module level so it can run in a worker process.
+    """
+    view = memoryview(_sort_pairs(level))
+    new = _new_keccak
+    return b"".join([new(view[i:i + 64]).digest() for i in range(0, len(view), 64)])
+
+
+def build_levels(leaves, workers=None):
+    """
+        Builds the same tree as submitProof.build_merkle, as a list of packed levels: levels[0] is
+        the leaves and levels[-1] the 32-byte root, each a bytes buffer of 32-byte nodes. A level with
+        an odd node count is hashed as if its last node were repeated, which is not stored.
+        leaves - as accepted by pack_leaves
+        workers - processes used for levels of POOL_MIN_PAIRS pairs or more; defaults to the CPU count
+    """
+    level = pack_leaves(leaves)
+    levels = [level]
+    workers = workers or os.cpu_count() or 1
+    executor = None
+    try:
+        while len(level) > 32:
+            if len(level) % 64:
+                level = level + level[-32:]
+            pairs = len(level) // 64
+            if workers > 1 and pairs >= POOL_MIN_PAIRS:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                # A few chunks per worker so one slow worker does not hold the level up
+                chunk = -(-pairs // (workers * 4)) * 64
+                level = b"".join(executor.map(hash_level, [level[i:i + chunk] for i in range(0, len(level), chunk)]))
+            else:
+                level = hash_level(level)
+            levels.append(level)
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    return levels
+
+
+def tree_from_levels(levels):
+    """
+        Returns packed levels as the list of lists of 32-byte nodes that prove_merkle takes
+    """
+    return [[level[i:i + 32] for i in range(0, len(level), 32)] for level in levels]
+
+
+def merkle_root(leaves, workers=None):
+    """
+        Returns the 32-byte root of the tree over leaves, or b"" for no leaves
+    """
+    return build_levels(leaves, workers)[-1]
@@ -0,0 +1,143 @@
+import threading
+from collections import OrderedDict
+from merkle_builder import keccak
+
+
+def _hash_pair(a, b):
+    return keccak(a + b if a < b else b + a)
+
+
+def tree_root(tree):
+    """
+        Returns the root of tree: build_merkle's list of lists, a MappedTree or an IncrementalMerkleTree
+    """
+    return bytes(tree[-1][0]) if len(tree[-1]) else b""
+
+
+def single_proof(tree, index):
+    """
+        Returns the proof of inclusion for leaf index, as prove_merkle does, for any tree type
+    """
+    if not 0 <= index < len(tree[0]):
+        raise IndexError("leaf index out of range")
+    proof = []
+    for level in range(len(tree) - 1):
+        nodes = tree[level]
+        proof.append(bytes(nodes[min(index ^ 1, len(nodes) - 1)]))
+        index //= 2
+    return proof
+
+
+def multiproof(tree, indices):
+    """
+        Returns one proof of inclusion for all the leaves at indices, in the format OpenZeppelin's
+        MerkleProof.multiProofVerify(proof, proofFlags, root, leaves) takes:
+        {"leaves", "proof", "proofFlags", "indices"}, with the leaves (and indices) in tree order.
+        The tree is walked once, a level at a time: a known node whose sibling is also known is
+        hashed with it (flag True), any other takes its sibling from the proof (flag False). Siblings
+        shared by several leaves therefore appear once, not once per leaf.
+    """
+    indices = sorted(set(indices))
+    if not indices:
+        raise ValueError("multiproof needs at least one index")
+    leaf_count = len(tree[0])
+    if indices[0] < 0 or indices[-1] >= leaf_count:
+        raise IndexError("leaf index out of range")
+    leaves = [bytes(tree[0][i]) for i in indices]
+    proof = []
+    flags = []
+    known = indices
+    for level in range(len(tree) - 1):
+        nodes = tree[level]
+        parents = []
+        i = 0
+        while i < len(known):
+            index = known[i]
+            if index % 2 == 0 and i + 1 < len(known) and known[i + 1] == index + 1:
+                flags.append(True)
+                i += 2
+            else:
+                # A last node without a sibling is hashed with itself, as build_merkle pads it
+                proof.append(bytes(nodes[min(index ^ 1, len(nodes) - 1)]))
+                flags.append(False)
+                i += 1
+            parents.append(index // 2)
+        known = parents
+    return {"leaves": leaves, "proof": proof, "proofFlags": flags, "indices": indices}
+
+
+def process_multiproof(leaves, proof, proof_flags):
+    """
+        Returns the root that leaves, proof and proof_flags hash up to, as OpenZeppelin's
+        MerkleProof.processMultiProof computes it. Raises ValueError for a malformed multiproof.
+    """
+    if len(leaves) + len(proof) != len(proof_flags) + 1:
+        raise ValueError("Invalid multiproof length")
+    hashes = []
+    leaf_pos = hash_pos = proof_pos = 0
+
+    def next_node():
+        # Leaves first, then the hashes computed so far, in order
+        nonlocal leaf_pos, hash_pos
+        if leaf_pos < len(leaves):
+            leaf_pos += 1
+            return bytes(leaves[leaf_pos - 1])
+        if hash_pos >= len(hashes):
+            raise ValueError("Invalid multiproof")
+        hash_pos += 1
+        return hashes[hash_pos - 1]
+
+    for flag in proof_flags:
+        a = next_node()
+        if flag:
+            b = next_node()
+        elif proof_pos < len(proof):
+            b = bytes(proof[proof_pos])
+            proof_pos += 1
+        else:
+            raise ValueError("Invalid multiproof")
+        hashes.append(_hash_pair(a, b))
+    if hashes:
+        if proof_pos != len(proof):
+            raise ValueError("Invalid multiproof")
+        return hashes[-1]
+    return bytes(leaves[0]) if leaves else bytes(proof[0])
+
+
+class ProofCache:
+    """
+        LRU cache of single-leaf proofs keyed by (root, index), so repeated requests for the same
+        leaf of the same tree skip the walk. A changed tree has a new root and so new keys; entries
+        for old roots simply age out.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._proofs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def proof(self, tree, index, root=None):
+        """
+            Returns the proof for leaf index of tree.
+            root - tree's root, when the caller already has it
+        """
+        key = (root if root is not None else tree_root(tree), index)
+        with self._lock:
+            proof = self._proofs.get(key)
+            if proof is not None:
+                self._proofs.move_to_end(key)
+                self.hits += 1
+                return list(proof)
+            self.misses += 1
+        proof = single_proof(tree, index)
+        with self._lock:
+            self._proofs[key] = tuple(proof)
+            while len(self._proofs) > self.maxsize:
+                self._proofs.popitem(last=False)
+        return proof
+
+    def clear(self):
+        with self._lock:
+            self._proofs.clear()
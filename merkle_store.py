@@ -0,0 +1,142 @@
+import mmap
+import os
+import struct
+from pathlib import Path
+from merkle_builder import build_levels, keccak
+
+
+DEFAULT_TREE_FILE = Path(__file__).parent.absolute() / "merkle_tree.bin"
+
+MAGIC = b"MRKLTRE1"
+# Magic, keccak of the tree's tag, level count; then an (offset, node count) pair per level
+_HEADER = struct.Struct("<8s32sI")
+_LEVEL = struct.Struct("<QQ")
+
+
+class MappedLevel:
+    """
+        One level of a MappedTree, indexed like a list of 32-byte nodes.
+        Each node is read from the map when it is asked for.
+    """
+
+    def __init__(self, tree_map, offset, count):
+        self._map = tree_map
+        self.offset = offset
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("node index out of range")
+        start = self.offset + 32 * index
+        return self._map[start:start + 32]
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+    def buffer(self):
+        """
+            Returns the whole level as a zero-copy memoryview of packed 32-byte nodes;
+            it must be released before the tree is closed
+        """
+        return memoryview(self._map)[self.offset:self.offset + 32 * self.count]
+
+
+class MappedTree:
+    """
+        A Merkle tree stored as one flat file of 32-byte nodes, level after level from the leaves to
+        the root, behind a small header giving each level's offset and node count.
+        The file is memory-mapped read-only, so opening it costs no hashing and no loading, and a
+        tree indexes like build_merkle's list of lists: prove_merkle(tree, index) reads its
+        O(log n) siblings straight from the map.
+        The header also holds the keccak of a tag naming what the tree was built from
+        (e.g. "primes:8192"), so load_or_build can tell a stale file from a reusable one.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._file = open(self.path, "rb")
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception:
+            self._file.close()
+            raise
+        try:
+            magic, self.tag_hash, level_count = _HEADER.unpack_from(self._map, 0)
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not a Merkle tree file")
+            self.levels = []
+            for i in range(level_count):
+                offset, count = _LEVEL.unpack_from(self._map, _HEADER.size + i * _LEVEL.size)
+                if offset + 32 * count > len(self._map):
+                    raise ValueError(f"{self.path} is truncated")
+                self.levels.append(MappedLevel(self._map, offset, count))
+        except (ValueError, struct.error):
+            self.close()
+            raise
+
+    @staticmethod
+    def write(path, levels, tag=""):
+        """
+            Writes packed levels (as build_levels returns them) to path; the file is replaced atomically
+        """
+        header_size = _HEADER.size + len(levels) * _LEVEL.size
+        # Node data starts on a 32-byte boundary
+        offset = -(-header_size // 32) * 32
+        header = [_HEADER.pack(MAGIC, keccak(tag.encode()), len(levels))]
+        for level in levels:
+            header.append(_LEVEL.pack(offset, len(level) // 32))
+            offset += len(level)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(b"".join(header).ljust(-(-header_size // 32) * 32, b"\0"))
+            for level in levels:
+                f.write(level)
+        os.replace(tmp_path, path)
+
+    def matches(self, tag):
+        return self.tag_hash == keccak(tag.encode())
+
+    @property
+    def root(self):
+        return self.levels[-1][0] if len(self.levels[-1]) else b""
+
+    def __len__(self):
+        return len(self.levels)
+
+    def __getitem__(self, level):
+        return self.levels[level]
+
+    def __iter__(self):
+        return iter(self.levels)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_or_build(tag, make_leaves, path=DEFAULT_TREE_FILE, workers=None):
+    """
+        Returns the MappedTree stored at path if it was built for tag; otherwise builds the tree over
+        make_leaves() (anything build_levels accepts), stores it at path and returns that
+    """
+    if os.path.exists(path):
+        try:
+            tree = MappedTree(path)
+            if tree.matches(tag):
+                return tree
+            tree.close()
+        except (ValueError, struct.error) as e:
+            print(f"Rebuilding Merkle tree file {path}: {e}")
+    MappedTree.write(path, build_levels(make_leaves(), workers), tag)
+    return MappedTree(path)
@@ -4,6 +4,8 @@ from web3 import Web3
 from web3.middleware import geth_poa_middleware
 from eth_account import Account
 from dotenv import load_dotenv
+from gas_profile import FALLBACK_GAS, GasProfiles
+from fee_oracle import get_oracle
 
 # -------------------- Config --------------------
 load_dotenv()
@@ -104,18 +106,15 @@ tx = contract.functions.claim(SENDER, nonce_bytes32).build_transaction({
     "from": SENDER,
     "nonce": w3.eth.get_transaction_count(SENDER),
     "chainId": CHAIN_ID,
-    # EIP-1559 fields (Fuji supports them)
-    "maxFeePerGas": w3.to_wei("60", "gwei"),
-    "maxPriorityFeePerGas": w3.to_wei("2", "gwei"),
+    # EIP-1559 fields (Fuji supports them), priced from recent blocks' fees
+    **get_oracle(w3, "avax").fees("fast"),
+    # Placeholder so build_transaction does not estimate; replaced by the learned limit below
+    "gas": FALLBACK_GAS,
 })
 
-# Estimate gas with buffer
-try:
-    gas_est = w3.eth.estimate_gas(tx)
-    tx["gas"] = int(gas_est * 1.2)
-except Exception:
-    # Fallback gas limit if estimation fails (typical mint fits well below this)
-    tx["gas"] = 300_000
+# Gas limit learned from earlier claim() receipts; only the first mint pays for a live estimate
+gas_profiles = GasProfiles()
+tx["gas"] = gas_profiles.gas_limit(w3, "avax", tx)
 
 signed = w3.eth.account.sign_transaction(tx, private_key=PRIVATE_KEY)
 tx_hash = w3.eth.send_raw_transaction(signed.rawTransaction)
@@ -124,6 +123,8 @@ print("Submitted claim tx:", tx_hash.hex())
 receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
 print(f"Mined in block {receipt.blockNumber}, status {receipt.status}")
 
+gas_profiles.observe_receipt("avax", tx, receipt)
+
 if receipt.status != 1:
     raise RuntimeError("Transaction failed on-chain.")
 
@@ -0,0 +1,256 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from web3.exceptions import TransactionNotFound
+
+
+DEFAULT_NONCE_DB = Path(__file__).parent.absolute() / "nonces.db"
+
+# Seconds after which a reservation that was never settled is treated as abandoned, even if the
+# process that holds it is still running
+RESERVATION_TTL = 600
+
+# Send errors that mean the nonce was consumed on chain, so it must not be handed out again
+_CONSUMED_MARKERS = ("nonce too low", "already known", "known transaction", "replacement transaction underpriced")
+
+# Send errors that mean a lower nonce has not reached the node yet, so the send can be retried
+_GAP_MARKERS = ("nonce too high", "invalid transaction nonce", "nonce gap")
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Someone else's process
+        return True
+    return True
+
+
+def is_nonce_gap(error):
+    """
+        Returns True if error shows the node is still waiting for a lower nonce
+    """
+    message = str(error).lower()
+    return any(marker in message for marker in _GAP_MARKERS) and "too low" not in message
+
+
+def nonce_replaced(w3, address, nonce, tx_hash, mined_count=None):
+    """
+        Returns True only once another transaction has used nonce: address's mined transaction count
+        is past it and the node no longer knows tx_hash. A transaction that is still in the mempool,
+        or mined before its receipt is indexed, is not replaced. A lookup that fails raises, so a
+        transport error never reads as a replacement.
+        mined_count - address's "latest" transaction count, when the caller has already fetched it
+    """
+    if mined_count is None:
+        mined_count = w3.eth.get_transaction_count(address, "latest")
+    if mined_count <= nonce:
+        return False
+    try:
+        w3.eth.get_transaction(tx_hash)
+    except TransactionNotFound:
+        return True
+    return False
+
+
+class NonceManager:
+    """
+        Hands out transaction nonces for one (chain, address) pair.
+        State lives in a local SQLite file and every allocation runs inside an immediate
+        transaction, so concurrent threads and processes never receive the same nonce.
+        Nonces whose send failed are released and handed out again before new ones,
+        so a failure never leaves a gap that stalls later transactions.
+        Each reservation records the process that holds it and when; sync() releases those whose
+        process has exited (a crash or Ctrl-C) or that are older than RESERVATION_TTL.
+    """
+
+    def __init__(self, w3, chain, address, db_path=DEFAULT_NONCE_DB):
+        self.w3 = w3
+        self.chain = chain
+        self.address = address
+        self.key = (chain, address.lower())
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        with self._transaction() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nonce_state ("
+                " chain TEXT NOT NULL, address TEXT NOT NULL, next_nonce INTEGER NOT NULL,"
+                " PRIMARY KEY (chain, address))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nonce_free ("
+                " chain TEXT NOT NULL, address TEXT NOT NULL, nonce INTEGER NOT NULL,"
+                " PRIMARY KEY (chain, address, nonce))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS nonce_reserved ("
+                " chain TEXT NOT NULL, address TEXT NOT NULL, nonce INTEGER NOT NULL,"
+                " owner INTEGER NOT NULL DEFAULT 0, reserved_at REAL NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (chain, address, nonce))"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(nonce_reserved)")}
+            if "owner" not in columns:
+                # Files from before reservations had owners; their rows read as abandoned
+                conn.execute("ALTER TABLE nonce_reserved ADD COLUMN owner INTEGER NOT NULL DEFAULT 0")
+                conn.execute("ALTER TABLE nonce_reserved ADD COLUMN reserved_at REAL NOT NULL DEFAULT 0")
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            try:
+                # Take the write lock up front so other processes wait instead of racing
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    yield conn
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+                conn.execute("COMMIT")
+            finally:
+                conn.close()
+
+    def _next_nonce(self, conn):
+        row = conn.execute(
+            "SELECT next_nonce FROM nonce_state WHERE chain = ? AND address = ?", self.key
+        ).fetchone()
+        return None if row is None else int(row[0])
+
+    def _set_next_nonce(self, conn, nonce):
+        conn.execute(
+            "INSERT INTO nonce_state (chain, address, next_nonce) VALUES (?, ?, ?) "
+            "ON CONFLICT(chain, address) DO UPDATE SET next_nonce = excluded.next_nonce",
+            self.key + (nonce,)
+        )
+
+    def sync(self, pending=None, latest=None):
+        """
+            Resynchronises with the chain's pending transaction count.
+            Callers that already hold the counts (e.g. from an async provider) can pass them in.
+            Nonces the chain has already used are dropped from the free list. Abandoned reservations
+            are released first (see expire_reservations). When the account has nothing pending and
+            no reservation is outstanding, nonces above the pending count were never accepted, so
+            allocation restarts from the pending count.
+        """
+        if pending is None:
+            pending = self.w3.eth.get_transaction_count(self.address, "pending")
+        if latest is None:
+            latest = self.w3.eth.get_transaction_count(self.address, "latest")
+        with self._transaction() as conn:
+            self._expire(conn)
+            next_nonce = self._next_nonce(conn)
+            conn.execute(
+                "DELETE FROM nonce_free WHERE chain = ? AND address = ? AND nonce < ?", self.key + (pending,)
+            )
+            outstanding = conn.execute(
+                "SELECT COUNT(*) FROM nonce_reserved WHERE chain = ? AND address = ?", self.key
+            ).fetchone()[0]
+            if next_nonce is None or next_nonce < pending or (latest == pending and outstanding == 0):
+                self._set_next_nonce(conn, pending)
+                conn.execute(
+                    "DELETE FROM nonce_free WHERE chain = ? AND address = ? AND nonce >= ?", self.key + (pending,)
+                )
+        return pending
+
+    def _expire(self, conn):
+        now = time.time()
+        expired = [
+            nonce for nonce, owner, reserved_at in conn.execute(
+                "SELECT nonce, owner, reserved_at FROM nonce_reserved WHERE chain = ? AND address = ?", self.key
+            ).fetchall()
+            if now - reserved_at > RESERVATION_TTL or (owner != os.getpid() and not _process_alive(owner))
+        ]
+        for nonce in expired:
+            # Whether it was sent is unknown; sync() drops it from the free list if the chain used it
+            conn.execute(
+                "DELETE FROM nonce_reserved WHERE chain = ? AND address = ? AND nonce = ?", self.key + (nonce,)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO nonce_free (chain, address, nonce) VALUES (?, ?, ?)", self.key + (nonce,)
+            )
+        return expired
+
+    def expire_reservations(self):
+        """
+            Releases reservations whose process has exited or that are older than RESERVATION_TTL,
+            and returns their nonces
+        """
+        with self._transaction() as conn:
+            return self._expire(conn)
+
+    def reserve(self):
+        """
+            Returns a nonce that no other caller holds, refilling released gaps first
+        """
+        with self._transaction() as conn:
+            row = conn.execute(
+                "SELECT MIN(nonce) FROM nonce_free WHERE chain = ? AND address = ?", self.key
+            ).fetchone()
+            if row[0] is not None:
+                nonce = int(row[0])
+                conn.execute(
+                    "DELETE FROM nonce_free WHERE chain = ? AND address = ? AND nonce = ?", self.key + (nonce,)
+                )
+            else:
+                nonce = self._next_nonce(conn)
+                if nonce is None:
+                    # Never synced; seed from the chain while holding the lock
+                    nonce = self.w3.eth.get_transaction_count(self.address, "pending")
+                self._set_next_nonce(conn, nonce + 1)
+            conn.execute(
+                "INSERT OR REPLACE INTO nonce_reserved (chain, address, nonce, owner, reserved_at)"
+                " VALUES (?, ?, ?, ?, ?)",
+                self.key + (nonce, os.getpid(), time.time())
+            )
+        return nonce
+
+    def mark_sent(self, nonce):
+        """
+            Records that a transaction using nonce was accepted by the node
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM nonce_reserved WHERE chain = ? AND address = ? AND nonce = ?", self.key + (nonce,)
+            )
+
+    def release(self, nonce):
+        """
+            Returns a reserved nonce whose send failed, so the next reserve() refills the gap
+        """
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM nonce_reserved WHERE chain = ? AND address = ? AND nonce = ?", self.key + (nonce,)
+            )
+            conn.execute(
+                "INSERT OR IGNORE INTO nonce_free (chain, address, nonce) VALUES (?, ?, ?)", self.key + (nonce,)
+            )
+
+    def fail(self, nonce, error):
+        """
+            Settles a reserved nonce after its send raised error.
+            The nonce is released unless the error shows the chain already consumed it.
+        """
+        if any(marker in str(error).lower() for marker in _CONSUMED_MARKERS):
+            self.mark_sent(nonce)
+        else:
+            self.release(nonce)
+
+    @contextmanager
+    def reservation(self):
+        """
+            Reserves a nonce for the body of a with-block.
+            The nonce is marked sent if the block completes and released if it raises, Ctrl-C
+            included, unless the error shows the chain already consumed it.
+        """
+        nonce = self.reserve()
+        try:
+            yield nonce
+        except BaseException as e:
+            self.fail(nonce, e)
+            raise
+        self.mark_sent(nonce)
@@ -0,0 +1,91 @@
+import math
+import numpy as np
+
+
+# Odd numbers covered by one sieve segment; at one byte each a segment stays inside a typical L2 cache
+SEGMENT_SIZE = 1 << 18
+
+
+def prime_bound(n):
+    """
+        Returns an upper bound on the nth prime: n(ln n + ln ln n) holds for n >= 6
+    """
+    if n < 6:
+        return 13
+    return int(n * (math.log(n) + math.log(math.log(n)))) + 1
+
+
+def _small_primes(limit):
+    """
+        Returns the primes <= limit as a list, with a plain sieve; only used for the sieving primes
+    """
+    if limit < 2:
+        return []
+    is_prime = np.ones(limit + 1, dtype=bool)
+    is_prime[:2] = False
+    for p in range(2, math.isqrt(limit) + 1):
+        if is_prime[p]:
+            is_prime[p * p::p] = False
+    return np.flatnonzero(is_prime).tolist()
+
+
+def iter_prime_segments(stop, start=2, segment_size=SEGMENT_SIZE):
+    """
+        Yields the primes in [start, stop) in ascending order, as one int64 array per segment.
+        Only odd numbers are sieved, segment_size of them at a time, so memory stays bounded by the
+        segment and the primes up to sqrt(stop) whatever the range.
+    """
+    if stop <= 2 or start >= stop:
+        return
+    if start <= 2:
+        yield np.array([2], dtype=np.int64)
+        start = 3
+    # Odd sieving primes; 2 never needs crossing off
+    base = _small_primes(math.isqrt(stop - 1))[1:]
+    low = start | 1
+    while low < stop:
+        high = min(low + 2 * segment_size, stop)
+        # segment[i] stands for low + 2i
+        segment = np.ones((high - low + 1) // 2, dtype=bool)
+        for p in base:
+            if p * p >= high:
+                break
+            first = max(p * p, (low + p - 1) // p * p)
+            if first % 2 == 0:
+                first += p
+            segment[(first - low) // 2::p] = False
+        yield low + 2 * np.flatnonzero(segment)
+        low = high | 1
+
+
+def primes_below(stop, dtype=np.uint64, segment_size=SEGMENT_SIZE):
+    """
+        Returns every prime below stop as one packed array of dtype
+    """
+    segments = list(iter_prime_segments(stop, segment_size=segment_size))
+    if not segments:
+        return np.empty(0, dtype=dtype)
+    return np.concatenate(segments).astype(dtype, copy=False)
+
+
+def first_primes(n, dtype=None, segment_size=SEGMENT_SIZE):
+    """
+        Returns the first n primes as one packed array.
+        dtype - defaults to uint32 when the nth prime fits in it, uint64 otherwise
+        The range is sieved up to prime_bound(n), which is never short, so it is never re-sieved;
+        segments are copied into the preallocated result and sieving stops once it is full.
+    """
+    bound = prime_bound(n)
+    if dtype is None:
+        dtype = np.uint32 if bound < 2 ** 32 else np.uint64
+    primes = np.empty(max(n, 0), dtype=dtype)
+    filled = 0
+    if n <= 0:
+        return primes
+    for segment in iter_prime_segments(bound + 1, segment_size=segment_size):
+        take = min(len(segment), n - filled)
+        primes[filled:filled + take] = segment[:take]
+        filled += take
+        if filled == n:
+            break
+    return primes
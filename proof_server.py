@@ -0,0 +1,187 @@
+"""
+    Serves Merkle proofs for the prime allowlist over HTTP/JSON:
+
+        python proof_server.py --port 8080
+
+        GET  /root                 {"root", "leaf_count", "depth"}
+        GET  /proof/<index>        {"index", "leaf", "proof", "root"}
+        GET  /multiproof?indices=1,5,9
+        POST /multiproof           body {"indices": [1, 5, 9]}
+                                   {"indices", "leaves", "proof", "proofFlags", "root"}
+
+    The tree is loaded once at startup from the memory-mapped tree file (built on first use), and
+    single proofs are answered from an LRU ProofCache. Byte values are 0x-prefixed hex.
+"""
+import argparse
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+from merkle_proofs import ProofCache, multiproof, tree_root
+from merkle_store import DEFAULT_TREE_FILE, load_or_build
+from prime_sieve import first_primes
+
+
+DEFAULT_PRIMES = 8192
+
+# Most leaves one /multiproof request may ask for
+MAX_MULTIPROOF_LEAVES = 1024
+
+
+def _hex(value):
+    return "0x" + bytes(value).hex()
+
+
+class ProofServer:
+    """
+        HTTP/JSON proof service over one Merkle tree (build_merkle's list of lists, a MappedTree or
+        an IncrementalMerkleTree). Connections are kept alive, one thread per connection.
+
+        Counters requests and errors track what was served.
+    """
+
+    def __init__(self, tree, host="127.0.0.1", port=0, cache_size=4096):
+        self.tree = tree
+        self.root = tree_root(tree)
+        self.leaf_count = len(tree[0])
+        self.cache = ProofCache(cache_size)
+        self._root_body = json.dumps({
+            "root": _hex(self.root), "leaf_count": self.leaf_count, "depth": len(tree) - 1,
+        }).encode()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def proof_body(self, index):
+        proof = self.cache.proof(self.tree, index, self.root)
+        return json.dumps({
+            "index": index,
+            "leaf": _hex(self.tree[0][index]),
+            "proof": [_hex(node) for node in proof],
+            "root": _hex(self.root),
+        }).encode()
+
+    def multiproof_body(self, indices):
+        if not indices or len(indices) > MAX_MULTIPROOF_LEAVES:
+            raise ValueError(f"indices must list 1 to {MAX_MULTIPROOF_LEAVES} leaves")
+        result = multiproof(self.tree, indices)
+        return json.dumps({
+            "indices": result["indices"],
+            "leaves": [_hex(leaf) for leaf in result["leaves"]],
+            "proof": [_hex(node) for node in result["proof"]],
+            "proofFlags": result["proofFlags"],
+            "root": _hex(self.root),
+        }).encode()
+
+    def _answer(self, method, path, body):
+        """
+            Returns (status, JSON body bytes) for one request
+        """
+        url = urlsplit(path)
+        parts = url.path.strip("/").split("/")
+        try:
+            if parts == ["root"] and method == "GET":
+                return 200, self._root_body
+            if len(parts) == 2 and parts[0] == "proof" and method == "GET":
+                index = int(parts[1])
+                if not 0 <= index < self.leaf_count:
+                    return 404, json.dumps({"error": f"No leaf {index}"}).encode()
+                return 200, self.proof_body(index)
+            if parts == ["multiproof"]:
+                if method == "POST":
+                    indices = json.loads(body or b"{}").get("indices", [])
+                else:
+                    indices = [i for value in parse_qs(url.query).get("indices", []) for i in value.split(",") if i]
+                indices = [int(i) for i in indices]
+                if any(not 0 <= i < self.leaf_count for i in indices):
+                    return 404, json.dumps({"error": "Index out of range"}).encode()
+                return 200, self.multiproof_body(indices)
+        except (ValueError, TypeError, AttributeError) as e:
+            return 400, json.dumps({"error": str(e)}).encode()
+        return 404, json.dumps({"error": f"Unknown path {url.path}"}).encode()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so a client does not pay a TCP handshake per proof; without Nagle, so the
+            # body is not held back behind the headers waiting for the client's delayed ACK
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def _reply(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = self.rfile.read(length) if length else b""
+                status, data = server._answer(method, self.path, body)
+                with server._lock:
+                    server.requests += 1
+                    server.errors += int(status != 200)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply("GET")
+
+            def do_POST(self):
+                self._reply("POST")
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def load_prime_tree(num_primes=DEFAULT_PRIMES, path=DEFAULT_TREE_FILE):
+    """
+        Returns the memory-mapped tree over the first num_primes primes, as merkle_assignment uses it
+    """
+    return load_or_build(f"primes:{num_primes}", lambda: first_primes(num_primes), path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Merkle proofs for the prime allowlist")
+    parser.add_argument("--primes", type=int, default=DEFAULT_PRIMES, help="number of primes (leaves) in the tree")
+    parser.add_argument("--tree-file", default=str(DEFAULT_TREE_FILE))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cache-size", type=int, default=4096, help="single proofs kept in the LRU cache")
+    args = parser.parse_args()
+
+    tree = load_prime_tree(args.primes, args.tree_file)
+    server = ProofServer(tree, args.host, args.port, args.cache_size)
+    print(f"Serving proofs for root {_hex(server.root)} ({server.leaf_count} leaves) on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,82 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from merkle_builder import POOL_MIN_PAIRS, hash_level, keccak
+
+
+def verify_proof(leaf, proof, root):
+    """
+        Returns True if proof (as prove_merkle returns it) shows that leaf is in the tree with root,
+        hashing sorted pairs as hash_pair and OpenZeppelin's MerkleProof.verify do
+    """
+    node = bytes(leaf)
+    for sibling in proof:
+        sibling = bytes(sibling)
+        node = keccak(node + sibling if node < sibling else sibling + node)
+    return node == bytes(root)
+
+
+def fold_proofs(leaves, proofs, depth):
+    """
+        Hashes N proofs of the same length up to their roots together.
+        leaves - N packed 32-byte leaves
+        proofs - the N proofs' siblings packed one proof after another, depth siblings each
+        Returns the N computed roots, packed.
+        Proofs of one tree share their upper nodes, so each step hashes only its distinct
+        (node, sibling) pairs: at most one per parent in the tree, however many claims there are.
+        Module level so it can run in a worker process.
+    """
+    nodes = np.frombuffer(leaves, dtype=np.uint8).reshape(-1, 32)
+    siblings = np.frombuffer(proofs, dtype=np.uint8).reshape(len(nodes), depth, 32)
+    for step in range(depth):
+        pairs = np.ascontiguousarray(np.concatenate([nodes, siblings[:, step]], axis=1))
+        distinct, inverse = np.unique(pairs.view(np.dtype((np.void, 64))).ravel(), return_inverse=True)
+        parents = np.frombuffer(hash_level(distinct.tobytes()), dtype=np.uint8).reshape(-1, 32)
+        nodes = parents[inverse.ravel()]
+    return nodes.tobytes()
+
+
+def verify_batch(claims, root, workers=1):
+    """
+        Checks many (leaf, proof) claims against root and returns one bool per claim, in order.
+        Claims are grouped by proof length and each group is hashed a proof step at a time over
+        packed buffers (see fold_proofs), with one vectorized sort and one raw keccak per distinct pair. A claim with a
+        leaf or sibling that is not 32 bytes is invalid.
+        workers - processes to split groups of POOL_MIN_PAIRS claims or more across; None for the CPU count
+        For callers checking many claims against one root at once, e.g. auditing every proof a
+        proof_server tree hands out; submitProof sends one claim per run and uses verify_proof.
+    """
+    root = np.frombuffer(bytes(root), dtype=np.uint8)
+    results = [False] * len(claims)
+    # proof length -> (claim positions, packed leaves, packed proofs)
+    groups = {}
+    for i, (leaf, proof) in enumerate(claims):
+        if len(leaf) != 32 or set(map(len, proof)) - {32}:
+            continue
+        group = groups.setdefault(len(proof), ([], [], []))
+        group[0].append(i)
+        group[1].append(bytes(leaf))
+        group[2].append(b"".join(proof))
+    workers = workers or os.cpu_count() or 1
+    executor = None
+    try:
+        jobs = []
+        for depth, (positions, leaves, proofs) in groups.items():
+            chunk = len(positions)
+            if workers > 1 and len(positions) >= POOL_MIN_PAIRS:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers=workers)
+                chunk = -(-len(positions) // (workers * 4))
+            for start in range(0, len(positions), chunk):
+                args = (b"".join(leaves[start:start + chunk]), b"".join(proofs[start:start + chunk]), depth)
+                computed = executor.submit(fold_proofs, *args) if executor is not None else fold_proofs(*args)
+                jobs.append((positions[start:start + chunk], computed))
+        for positions, computed in jobs:
+            computed = computed if isinstance(computed, bytes) else computed.result()
+            matches = (np.frombuffer(computed, dtype=np.uint8).reshape(-1, 32) == root).all(axis=1)
+            for i, match in zip(positions, matches.tolist()):
+                results[i] = match
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+    return results
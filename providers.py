@@ -0,0 +1,109 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3.providers.rpc import HTTPProvider
+from web3.middleware import ExtraDataToPOAMiddleware  # Necessary for POA chains
+from hedged_provider import HedgedHTTPProvider
+from rpc_metrics import metrics_middleware
+
+
+RPC_URLS = {
+    'avax': "https://api.avax-test.network/ext/bc/C/rpc",  # AVAX C-chain testnet
+    'bsc': "https://data-seed-prebsc-1-s1.binance.org:8545/",  # BSC testnet (public RPC)
+    'bsc-infura': "https://bsc-testnet.infura.io/v3/198ba796b8a548cbb6b4ce669df25a6e",  # BSC testnet (Infura)
+    'eth': "https://mainnet.infura.io/v3/198ba796b8a548cbb6b4ce669df25a6e",  # Ethereum mainnet (Infura)
+}
+
+# Chains served by several interchangeable public endpoints; reads are routed to the fastest
+# healthy one and hedged to the next when it is slow
+RPC_ENDPOINTS = {
+    'avax': [
+        RPC_URLS['avax'],
+        "https://avalanche-fuji-c-chain-rpc.publicnode.com",
+    ],
+    'bsc': [
+        RPC_URLS['bsc'],
+        "https://data-seed-prebsc-2-s1.binance.org:8545/",
+        "https://bsc-testnet-rpc.publicnode.com",
+    ],
+}
+
+# Chains whose blocks carry POA extraData and need ExtraDataToPOAMiddleware
+POA_CHAINS = {'avax', 'bsc', 'bsc-infura'}
+
+# Enough pooled connections per host for the relay senders and batch fetchers to run concurrently
+POOL_MAXSIZE = 32
+REQUEST_TIMEOUT = 30
+
+_session = None
+_registry = {}
+_connected = set()
+_lock = threading.Lock()
+
+
+def get_session():
+    """
+        Returns the process-wide keep-alive requests.Session every HTTP provider shares,
+        so repeated calls reuse open TCP/TLS connections
+    """
+    global _session
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=16, pool_maxsize=POOL_MAXSIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def set_endpoints(chain, urls):
+    """
+        Points chain at urls (e.g. a local replay server) for every later get_web3(chain) call.
+        Instances already handed out keep their old endpoints.
+    """
+    urls = [urls] if isinstance(urls, str) else list(urls)
+    with _lock:
+        RPC_URLS[chain] = urls[0]
+        if len(urls) > 1:
+            RPC_ENDPOINTS[chain] = urls
+        else:
+            RPC_ENDPOINTS.pop(chain, None)
+
+
+def get_web3(chain, check_connection=False, poa=None):
+    """
+        chain - a key of RPC_URLS, an RPC URL, or a list of RPC URLs for the same chain
+        check_connection - if True, assert the endpoint answers; only checked the first time
+        poa - whether to inject the POA middleware, defaults to True for the chains in POA_CHAINS
+        Returns the cached Web3 instance for chain, creating it on first use.
+        Chains in RPC_ENDPOINTS, and lists of URLs, get a HedgedHTTPProvider over all endpoints.
+        Every request is recorded in rpc_metrics.METRICS under chain (or the URL when given URLs).
+    """
+    if isinstance(chain, (list, tuple)):
+        endpoints = list(chain)
+    else:
+        endpoints = RPC_ENDPOINTS.get(chain, [RPC_URLS.get(chain, chain)])
+    url = " | ".join(endpoints)
+    if poa is None:
+        poa = not isinstance(chain, (list, tuple)) and chain in POA_CHAINS
+    session = get_session()
+    with _lock:
+        w3 = _registry.get((url, poa))
+        if w3 is None:
+            if len(endpoints) > 1:
+                provider = HedgedHTTPProvider(endpoints, session=session, request_timeout=REQUEST_TIMEOUT)
+            else:
+                provider = HTTPProvider(url, session=session, request_kwargs={"timeout": REQUEST_TIMEOUT})
+            w3 = Web3(provider)
+            if poa:
+                # inject the poa compatibility middleware to the innermost layer
+                w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+            label = chain if isinstance(chain, str) else url
+            w3.middleware_onion.add(metrics_middleware(label), name="rpc_metrics")
+            _registry[(url, poa)] = w3
+    if check_connection and url not in _connected:
+        assert w3.is_connected(), f"Failed to connect to provider at {url}"
+        _connected.add(url)
+    return w3
@@ -1,8 +1,8 @@
-import random
 import json
 from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware
-from web3.providers.rpc import HTTPProvider
+import providers
+from rpc_batch import get_transactions
+import block_ordering
 
 
 # If you use one of the suggested infrastructure providers, the url will be of the form
@@ -12,9 +12,8 @@ from web3.providers.rpc import HTTPProvider
 
 def connect_to_eth():
 	# TODO insert your code for this method from last week's assignment
-	url = "https://mainnet.infura.io/v3/198ba796b8a548cbb6b4ce669df25a6e"  # FILL THIS IN
-	w3 = Web3(HTTPProvider(url))
-	assert w3.is_connected(), f"Failed to connect to provider at {url}"
+	# Cached instance on a shared keep-alive session; connectivity is only asserted on first use
+	w3 = providers.get_web3('eth', check_connection=True)
 	return w3
 
 
@@ -26,10 +25,7 @@ def connect_with_middleware(contract_json):
 		address = d['address']
 		abi = d['abi']
 
-	bnb_testnet_url = "https://bsc-testnet.infura.io/v3/198ba796b8a548cbb6b4ce669df25a6e"
-	w3 = Web3(HTTPProvider(bnb_testnet_url))
-	assert w3.is_connected(), f"Failed to connect to BNB testnet provider at {bnb_testnet_url}"
-	w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
+	w3 = providers.get_web3('bsc-infura', check_connection=True)
 	contract = w3.eth.contract(address=address, abi=abi)
 
 	return w3, contract
@@ -52,82 +48,27 @@ def is_ordered_block(w3, block_num):
 	ordered = False
 
 	# TODO YOUR CODE HERE
-	def _get(tx, key):
-		try:
-			if isinstance(tx, dict):
-				val = tx.get(key)
-			else:
-				val = getattr(tx, key, None)
-			return int(val) if val is not None else None
-		except Exception:
-			return None
-
 	base_fee = block.get('baseFeePerGas', None)
 	txs = block.get('transactions', [])
 
-	# Always call get_transaction() for each tx as required
-	full_txs = []
+	# Always call get_transaction() for each tx as required, packed into JSON-RPC batches.
+	# block_ordering.analyze_range classifies from the block payload alone, for many blocks.
+	tx_hashes = []
 	for tx in txs:
-		tx_hash = None
 		if isinstance(tx, dict):
-			tx_hash = tx.get('hash')
-		else:
-			tx_hash = getattr(tx, 'hash', None)
-		try:
-			if tx_hash is not None:
-				full_txs.append(w3.eth.get_transaction(tx_hash))
-			else:
-				full_txs.append(tx)  # fallback
-		except Exception:
-			full_txs.append(tx)  # fallback if provider can’t refetch
-
-	txs = full_txs
-
-	# 0 or 1 transaction => trivially ordered
-	if len(txs) <= 1:
-		ordered = True
-	else:
-		def is_nonincreasing(seq):
-			prev = None
-			for x in seq:
-				if prev is not None and x > prev:
-					return False
-				prev = x
-			return True
-
-		# Pre-EIP-1559: order by gasPrice only
-		if base_fee is None:
-			gps = [(_get(tx, 'gasPrice') or 0) for tx in txs]
-			ordered = is_nonincreasing(gps)
+			tx_hashes.append(tx.get('hash'))
 		else:
-			base_fee = int(base_fee)
-			all_have_gasprice = all(_get(tx, 'gasPrice') is not None for tx in txs)
-
-			if all_have_gasprice:
-				gps = [_get(tx, 'gasPrice') for tx in txs]
-				ordered = is_nonincreasing(gps)
-			else:
-				# Compute effective priority fee per gas for each tx
-				def tip(tx):
-					mp = _get(tx, 'maxPriorityFeePerGas')
-					mf = _get(tx, 'maxFeePerGas')
-					gp = _get(tx, 'gasPrice')
-
-					# Type 2 if maxPriorityFeePerGas present (even if gasPrice exists)
-					if mp is not None:
-						if mf is not None:
-							return min(mp, max(mf - base_fee, 0))
-						return max(mp, 0)
-
-					# Legacy type 0: priority = gasPrice - baseFee
-					if gp is not None:
-						return max(gp - base_fee, 0)
-
-					# Missing fields => treat as 0
-					return 0
-
-				tips = [tip(tx) for tx in txs]
-				ordered = is_nonincreasing(tips)
+			tx_hashes.append(getattr(tx, 'hash', None))
+	to_fetch = [h for h in tx_hashes if h is not None]
+	try:
+		fetched = iter(get_transactions(w3, to_fetch))
+		full_txs = [next(fetched) if h is not None else tx for tx, h in zip(txs, tx_hashes)]
+	except Exception:
+		full_txs = list(txs)  # fallback if provider can’t refetch
+
+	# Ranked by gasPrice before EIP-1559 or when every tx has one, else by effective priority fee
+	_, fees = block_ordering.fee_sequence(full_txs, base_fee)
+	ordered = block_ordering.first_violation(fees) is None
 
 	return ordered
 
@@ -177,14 +118,17 @@ if __name__ == "__main__":
 	cont_w3, contract = connect_with_middleware(contract_file)
 
 	latest_block = eth_w3.eth.get_block_number()
-	london_hard_fork_block_num = 12965000
-	assert latest_block > london_hard_fork_block_num, f"Error: the chain never got past the London Hard Fork"
-
-	n = 5
-	for _ in range(n):
-		block_num = random.randint(1, latest_block)
-		ordered = is_ordered_block(block_num)
-		if ordered:
-			print(f"Block {block_num} is ordered")
+	assert latest_block > block_ordering.LONDON_BLOCK, f"Error: the chain never got past the London Hard Fork"
+
+	# One full-block RPC per block, many blocks in flight
+	n = 1000
+	block_numbers = block_ordering.sample_blocks(latest_block, n)
+	verdicts, stats = block_ordering.analyze_blocks(eth_w3, block_numbers)
+	for v in verdicts[:5]:
+		if v.get('error'):
+			print(f"Block {v['block']} could not be fetched: {v['error']}")
+		elif v['ordered']:
+			print(f"Block {v['block']} is ordered")
 		else:
-			print(f"Block {block_num} is not ordered")
+			print(f"Block {v['block']} is not ordered")
+	block_ordering.print_stats(stats)
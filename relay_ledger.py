@@ -0,0 +1,170 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from event_records import EventRecord
+
+
+DEFAULT_LEDGER_DB = Path(__file__).parent.absolute() / "relay_ledger.db"
+
+# Transaction hashes per IN (...) query when checking keys missing from memory
+LOOKUP_CHUNK = 500
+
+# Times an event whose relay reverted or was replaced is relayed again before it is given up on
+MAX_RELAY_RETRIES = 3
+
+
+def event_key(ev):
+    """
+        Returns the (transaction hash bytes, log index) pair that identifies an event log.
+        ev is an event_records record or a web3 event dict.
+    """
+    if isinstance(ev, EventRecord):
+        return ev.tx_hash, ev.log_index
+    tx_hash = ev["transactionHash"]
+    if isinstance(tx_hash, str):
+        tx_hash = bytes.fromhex(tx_hash[2:] if tx_hash.startswith("0x") else tx_hash)
+    return bytes(tx_hash), int(ev["logIndex"])
+
+
+class RelayLedger:
+    """
+        Record of every event that has already been relayed, keyed by (chain, transactionHash, logIndex).
+        Keys are kept in a local SQLite table (32-byte hash blobs) and mirrored in an in-memory set,
+        so checking an event costs one set lookup. Keys missing from the set are also looked up in
+        SQLite, all of a filter_new() call's in one query, in case another process relayed them
+        since this ledger was loaded.
+        An event whose relay failed on chain is taken back out with forget_relay() and listed by
+        retries() until it has been retried MAX_RELAY_RETRIES times.
+    """
+
+    def __init__(self, db_path=DEFAULT_LEDGER_DB):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+        self._seen = {}
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS relayed ("
+                " chain TEXT NOT NULL,"
+                " tx_hash BLOB NOT NULL,"
+                " log_index INTEGER NOT NULL,"
+                " relay_tx_hash BLOB,"
+                " PRIMARY KEY (chain, tx_hash, log_index)) WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS relayed_by_relay_tx ON relayed (chain, relay_tx_hash)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS relay_retry ("
+                " chain TEXT NOT NULL,"
+                " tx_hash BLOB NOT NULL,"
+                " log_index INTEGER NOT NULL,"
+                " attempts INTEGER NOT NULL,"
+                " PRIMARY KEY (chain, tx_hash, log_index)) WITHOUT ROWID"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _chain_keys(self, chain):
+        # Loaded once per chain, then kept current by mark()
+        if chain not in self._seen:
+            with self._connect() as conn:
+                rows = conn.execute("SELECT tx_hash, log_index FROM relayed WHERE chain = ?", (chain,))
+                self._seen[chain] = {(bytes(tx_hash), log_index) for tx_hash, log_index in rows}
+        return self._seen[chain]
+
+    def _lookup(self, conn, chain, keys):
+        """
+            Returns which of keys SQLite has for chain
+        """
+        found = set()
+        hashes = sorted({tx_hash for tx_hash, _ in keys})
+        for start in range(0, len(hashes), LOOKUP_CHUNK):
+            chunk = hashes[start:start + LOOKUP_CHUNK]
+            placeholders = ", ".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT tx_hash, log_index FROM relayed WHERE chain = ? AND tx_hash IN ({placeholders})",
+                [chain] + chunk
+            )
+            found.update((bytes(tx_hash), log_index) for tx_hash, log_index in rows)
+        return found & set(keys)
+
+    def seen(self, chain, ev):
+        """
+            Returns True if event ev on chain has already been relayed
+        """
+        return not self.filter_new(chain, [ev])
+
+    def filter_new(self, chain, events):
+        """
+            Returns the events in events that have not been relayed yet, in their original order
+        """
+        keys = [event_key(ev) for ev in events]
+        with self._lock:
+            known = self._chain_keys(chain)
+            missing = [key for key in keys if key not in known]
+            if missing:
+                with self._connect() as conn:
+                    known.update(self._lookup(conn, chain, missing))
+        return [ev for ev, key in zip(events, keys) if key not in known]
+
+    def mark(self, chain, ev, relay_tx_hash=None):
+        """
+            Records that event ev on chain has been relayed by transaction relay_tx_hash
+        """
+        key = event_key(ev)
+        relay_tx_hash = None if relay_tx_hash is None else bytes(relay_tx_hash)
+        with self._lock:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR IGNORE INTO relayed (chain, tx_hash, log_index, relay_tx_hash) VALUES (?, ?, ?, ?)",
+                    (chain,) + key + (relay_tx_hash,)
+                )
+            self._chain_keys(chain).add(key)
+
+    def forget_relay(self, chain, relay_tx_hash):
+        """
+            Takes the events relayed by relay_tx_hash (bytes or hex string) back out of the ledger,
+            after that transaction reverted or another one took its nonce, and queues them for retries().
+            Returns the number of events forgotten.
+        """
+        if isinstance(relay_tx_hash, str):
+            relay_tx_hash = bytes.fromhex(relay_tx_hash[2:] if relay_tx_hash.startswith("0x") else relay_tx_hash)
+        with self._lock:
+            with self._connect() as conn:
+                keys = [
+                    (bytes(tx_hash), log_index) for tx_hash, log_index in conn.execute(
+                        "SELECT tx_hash, log_index FROM relayed WHERE chain = ? AND relay_tx_hash = ?",
+                        (chain, bytes(relay_tx_hash))
+                    )
+                ]
+                for key in keys:
+                    conn.execute(
+                        "DELETE FROM relayed WHERE chain = ? AND tx_hash = ? AND log_index = ?", (chain,) + key
+                    )
+                    conn.execute(
+                        "INSERT INTO relay_retry (chain, tx_hash, log_index, attempts) VALUES (?, ?, ?, 1) "
+                        "ON CONFLICT(chain, tx_hash, log_index) DO UPDATE SET attempts = attempts + 1",
+                        (chain,) + key
+                    )
+            self._chain_keys(chain).difference_update(keys)
+        return len(keys)
+
+    def retries(self, chain):
+        """
+            Returns the (transaction hash, log index) keys of the forgotten events on chain that are
+            not relayed again yet and have retries left
+        """
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT r.tx_hash, r.log_index FROM relay_retry r WHERE r.chain = ? AND r.attempts <= ?"
+                " AND NOT EXISTS (SELECT 1 FROM relayed d"
+                "  WHERE d.chain = r.chain AND d.tx_hash = r.tx_hash AND d.log_index = r.log_index)",
+                (chain, MAX_RELAY_RETRIES)
+            ).fetchall()
+        return [(bytes(tx_hash), log_index) for tx_hash, log_index in rows]
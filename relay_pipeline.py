@@ -0,0 +1,380 @@
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from eth_account import Account
+from rpc_batch import batch_call
+from web3.exceptions import TransactionNotFound
+from nonce_manager import is_nonce_gap, nonce_replaced
+from rpc_metrics import METRICS
+
+
+# (chain, sender address) -> ConfirmationTracker, so repeated scans share one polling thread per key
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def sign_transaction(tx, private_key):
+    """
+        Signs tx and returns the raw transaction bytes.
+        Module level so it can run in a worker process.
+    """
+    signed = Account.sign_transaction(tx, private_key)
+    # web3 v6 names the field rawTransaction, v7 raw_transaction
+    if hasattr(signed, "raw_transaction"):
+        return bytes(signed.raw_transaction)
+    return bytes(signed.rawTransaction)
+
+
+def timed_sign_transaction(tx, private_key):
+    """
+        Like sign_transaction, but returns (raw transaction bytes, seconds spent signing),
+        measured in the worker so queueing time is not counted
+    """
+    start = time.perf_counter()
+    raw_tx = sign_transaction(tx, private_key)
+    return raw_tx, time.perf_counter() - start
+
+
+class ChainParams:
+    """
+        Caches the chain parameters every relay transaction needs.
+        The chain id is fetched once. Fees come from oracle (a fee_oracle.FeeOracle) at speed when
+        one is given; otherwise the node's gas price is used, refreshed at most every ttl seconds.
+    """
+
+    def __init__(self, w3, ttl=15, oracle=None, speed="standard"):
+        self.w3 = w3
+        self.ttl = ttl
+        self.oracle = oracle
+        self.speed = speed
+        self._lock = threading.Lock()
+        self._chain_id = None
+        self._gas_price = None
+        self._fetched_at = 0.0
+
+    def get(self):
+        """
+            Returns (chain_id, fees), fees being the fee fields of the transaction:
+            {"gasPrice"} or {"maxFeePerGas", "maxPriorityFeePerGas"}
+        """
+        with self._lock:
+            if self._chain_id is None:
+                self._chain_id = self.w3.eth.chain_id
+            if self.oracle is not None:
+                return self._chain_id, self.oracle.fees(self.speed)
+            if self._gas_price is None or time.monotonic() - self._fetched_at > self.ttl:
+                self._gas_price = self.w3.eth.gas_price
+                self._fetched_at = time.monotonic()
+            return self._chain_id, {"gasPrice": self._gas_price}
+
+
+class ConfirmationTracker:
+    """
+        Tracks broadcast transactions on a background thread.
+        Each poll asks for the sender's mined transaction count, then fetches receipts in one batch
+        only for the tracked nonces below it. A transaction stays tracked until its receipt arrives,
+        or until nonce_replaced shows another transaction used its nonce; a failed fetch is retried
+        on the next poll.
+    """
+
+    def __init__(self, w3, address, poll_interval=2.0):
+        self.w3 = w3
+        self.address = address
+        self.poll_interval = poll_interval
+        self.receipts = {}
+        self._pending = {}
+        self._callbacks = {}
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def track(self, nonce, tx_hash, on_confirmed=None):
+        with self._cond:
+            self._pending[nonce] = tx_hash
+            if on_confirmed is not None:
+                self._callbacks[tx_hash] = on_confirmed
+            self._cond.notify_all()
+
+    def wait(self, timeout=None):
+        """
+            Blocks until every tracked transaction is mined or timeout passes.
+            Returns True if nothing is left pending.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._stopping:
+                    self._cond.wait()
+                if self._stopping:
+                    return
+            try:
+                self._poll()
+            except Exception as e:
+                print(f"Error polling confirmations: {e}")
+            with self._cond:
+                if self._stopping:
+                    return
+                self._cond.wait(self.poll_interval)
+
+    def _poll(self):
+        mined_count = self.w3.eth.get_transaction_count(self.address, "latest")
+        with self._cond:
+            mined = [(n, h) for n, h in self._pending.items() if n < mined_count]
+        if not mined:
+            return
+        receipts = batch_call(
+            self.w3, [lambda h=h: self.w3.eth.get_transaction_receipt(h) for _, h in mined], return_exceptions=True
+        )
+        confirmed = []
+        for (nonce, tx_hash), receipt in zip(mined, receipts):
+            if receipt is None or isinstance(receipt, TransactionNotFound):
+                try:
+                    if not nonce_replaced(self.w3, self.address, nonce, tx_hash, mined_count):
+                        # Mined but not indexed yet on this node
+                        continue
+                except Exception as e:
+                    print(f"Error checking whether {tx_hash.hex()} was replaced: {e}")
+                    continue
+                # Another transaction took this nonce
+                receipt = None
+            elif isinstance(receipt, Exception):
+                # Transport error; the next poll asks again
+                continue
+            confirmed.append((nonce, tx_hash, receipt))
+        callbacks = []
+        with self._cond:
+            for nonce, tx_hash, receipt in confirmed:
+                self.receipts[tx_hash] = receipt
+                del self._pending[nonce]
+                if tx_hash in self._callbacks:
+                    callbacks.append((self._callbacks.pop(tx_hash), receipt))
+            self._cond.notify_all()
+        for callback, receipt in callbacks:
+            try:
+                callback(receipt)
+            except Exception as e:
+                print(f"Error handling a confirmation: {e}")
+
+
+def get_tracker(w3, chain, address, **kwargs):
+    """
+        Returns the process-wide ConfirmationTracker for address on chain, creating it on first use
+    """
+    with _trackers_lock:
+        key = (chain, address.lower())
+        tracker = _trackers.get(key)
+        if tracker is None or tracker.w3 is not w3:
+            if tracker is not None:
+                tracker.stop()
+            tracker = ConfirmationTracker(w3, address, **kwargs)
+            _trackers[key] = tracker
+        return tracker
+
+
+def stop_trackers():
+    """
+        Stops every process-wide ConfirmationTracker's polling thread, so the next get_tracker starts a fresh one
+    """
+    with _trackers_lock:
+        trackers = list(_trackers.values())
+        _trackers.clear()
+    for tracker in trackers:
+        tracker.stop()
+
+
+class RelayPipeline:
+    """
+        Relays contract calls through separate stages so a burst of events overlaps work:
+        transactions are built from cached chain parameters on the caller's thread, signed by a
+        worker pool, and broadcast by a pool of concurrent senders. Optionally a ConfirmationTracker
+        follows each broadcast transaction until it is mined, without holding up later relays.
+
+        nonces - a NonceManager for the sending account
+        sign_executor - executor used for signing; defaults to a process pool of sign_workers
+        chain - label the build, sign and send phases are recorded under in rpc_metrics.METRICS,
+                and the chain gas profiles are kept under
+        gas_profiles - optional GasProfiles; when given, each transaction's gas limit comes from it
+                       instead of gas, and every sent transaction is tracked so its receipt can refine it
+                       (as soon as tracker sees it mined, or on a later GasProfiles.settle)
+    """
+
+    def __init__(self, w3, contract, fn_name, private_key, nonces, gas=300000,
+                 sign_workers=4, send_workers=8, sign_executor=None, params=None, tracker=None,
+                 gap_timeout=60, chain="default", gas_profiles=None):
+        self.w3 = w3
+        self.chain = chain
+        self.gas_profiles = gas_profiles
+        self.contract = contract
+        self.fn_name = fn_name
+        self.private_key = private_key
+        self.address = Account.from_key(private_key).address
+        self.nonces = nonces
+        self.gas = gas
+        self.params = params if params is not None else ChainParams(w3)
+        self.tracker = tracker
+        self.gap_timeout = gap_timeout
+        # nonce -> [settled event, accepted flag] for every send this pipeline has started
+        self._sends = {}
+        self._sends_lock = threading.Lock()
+        # Signed transactions are handed to the senders in submission (and so nonce) order
+        self._next_seq = 0
+        self._dispatch_seq = 0
+        self._ready = {}
+        self._own_sign_executor = sign_executor is None
+        self.sign_executor = sign_executor if sign_executor is not None else ProcessPoolExecutor(max_workers=sign_workers)
+        self.send_executor = ThreadPoolExecutor(max_workers=send_workers)
+        self._submitted = []
+
+    def submit(self, call_args, token=None, on_confirmed=None):
+        """
+            Queues one relay of fn_name(*call_args).
+            token - the token the call moves, so gas profiles are kept per token
+            on_confirmed - optional callable (tx_hash, receipt) the tracker runs once the transaction is
+                           mined; receipt is None if another transaction took its nonce
+            Returns a Future resolving to the transaction hash once the node accepted it.
+        """
+        result = Future()
+        self._submitted.append(result)
+        try:
+            chain_id, fees = self.params.get()
+            nonce = self.nonces.reserve()
+        except Exception as e:
+            result.set_exception(e)
+            return result
+        with self._sends_lock:
+            self._sends[nonce] = [threading.Event(), False]
+            seq = self._next_seq
+            self._next_seq += 1
+        try:
+            with METRICS.phase(self.chain, "build"):
+                tx = getattr(self.contract.functions, self.fn_name)(*call_args).build_transaction({
+                    "from": self.address,
+                    "nonce": nonce,
+                    "gas": self.gas,
+                    "chainId": chain_id,
+                    **fees,
+                })
+                if self.gas_profiles is not None:
+                    tx["gas"] = self.gas_profiles.gas_limit(self.w3, self.chain, tx, token)
+            signing = self.sign_executor.submit(timed_sign_transaction, tx, self.private_key)
+        except BaseException as e:
+            self._settle(nonce, False)
+            self.nonces.fail(nonce, e)
+            result.set_exception(e)
+            self._dispatch(seq, None)
+            if not isinstance(e, Exception):
+                # Ctrl-C: the nonce is released, but the interrupt still stops the caller
+                raise
+            return result
+        signing.add_done_callback(lambda f: self._on_signed(f, seq, nonce, result, tx, token, on_confirmed))
+        return result
+
+    def _settle(self, nonce, accepted):
+        with self._sends_lock:
+            entry = self._sends.get(nonce)
+        if entry is not None:
+            entry[1] = accepted
+            entry[0].set()
+
+    def _wait_for_lower(self, nonce):
+        """
+            Waits for the send of nonce - 1 to settle.
+            Returns True if it was accepted, so nonce can be retried.
+        """
+        with self._sends_lock:
+            entry = self._sends.get(nonce - 1)
+        if entry is None:
+            # The lower nonce belongs to another sender; give it a moment to arrive
+            time.sleep(0.5)
+            return True
+        return entry[0].wait(self.gap_timeout) and entry[1]
+
+    def _dispatch(self, seq, send):
+        """
+            Queues send (or None for a relay that failed before sending) and starts every send
+            whose predecessors have all been started
+        """
+        with self._sends_lock:
+            self._ready[seq] = send
+            while self._dispatch_seq in self._ready:
+                ready = self._ready.pop(self._dispatch_seq)
+                self._dispatch_seq += 1
+                if ready is not None:
+                    self.send_executor.submit(ready)
+
+    def _on_signed(self, signing, seq, nonce, result, tx, token, on_confirmed):
+        try:
+            raw_tx, seconds = signing.result()
+        except Exception as e:
+            self._settle(nonce, False)
+            self.nonces.fail(nonce, e)
+            result.set_exception(e)
+            self._dispatch(seq, None)
+            return
+        METRICS.observe_phase(self.chain, "sign", seconds)
+        self._dispatch(seq, lambda: self._send(raw_tx, nonce, result, tx, token, on_confirmed))
+
+    def _send(self, raw_tx, nonce, result, tx, token, on_confirmed):
+        attempts = 0
+        while True:
+            try:
+                with METRICS.phase(self.chain, "send"):
+                    tx_hash = self.w3.eth.send_raw_transaction(raw_tx)
+                break
+            except Exception as e:
+                # Nodes that do not queue future nonces reject a send that overtook a lower nonce;
+                # retry once the lower nonce has been accepted
+                if is_nonce_gap(e) and attempts < 3 and self._wait_for_lower(nonce):
+                    attempts += 1
+                    continue
+                self._settle(nonce, False)
+                self.nonces.fail(nonce, e)
+                result.set_exception(e)
+                return
+        self._settle(nonce, True)
+        self.nonces.mark_sent(nonce)
+        if self.gas_profiles is not None:
+            try:
+                self.gas_profiles.track(self.chain, tx_hash, tx, token)
+            except Exception as e:
+                print(f"Error tracking gas for {tx_hash.hex()}: {e}")
+        if self.tracker is not None:
+            self.tracker.track(nonce, tx_hash, lambda receipt: self._on_confirmed(tx_hash, receipt, on_confirmed))
+        result.set_result(tx_hash)
+
+    def _on_confirmed(self, tx_hash, receipt, on_confirmed):
+        if self.gas_profiles is not None and receipt is not None:
+            try:
+                self.gas_profiles.settle_receipt(self.chain, tx_hash, receipt)
+            except Exception as e:
+                print(f"Error learning gas from {tx_hash.hex()}: {e}")
+        if on_confirmed is not None:
+            on_confirmed(tx_hash, receipt)
+
+    def close(self):
+        """
+            Waits for every submitted relay to finish, then shuts the worker pools down
+        """
+        wait(self._submitted)
+        self._submitted = []
+        with self._sends_lock:
+            self._sends = {}
+        self.send_executor.shutdown(wait=True)
+        if self._own_sign_executor:
+            self.sign_executor.shutdown(wait=True)
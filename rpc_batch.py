@@ -0,0 +1,92 @@
+import threading
+from log_fetcher import endpoint_key
+
+
+DEFAULT_BATCH_SIZE = 500
+
+# Whether each endpoint answers eth_getBlockReceipts; endpoints start out assumed to support it
+_block_receipts_supported = {}
+_support_lock = threading.Lock()
+
+_UNSUPPORTED_MARKERS = ("method not found", "does not exist", "not supported", "not available", "-32601")
+
+
+def batch_call(w3, calls, batch_size=DEFAULT_BATCH_SIZE, return_exceptions=False):
+    """
+        w3 - a web3 instance
+        calls - list of zero-argument callables that each issue one request on w3,
+                e.g. lambda: w3.eth.get_transaction(tx_hash)
+        return_exceptions - if True, a call that fails on its own is returned as its exception
+                            instead of raising
+        Returns the results in the same order as calls.
+
+        Calls are packed batch_size at a time into a single JSON-RPC batch. A batch the node
+        rejects is split in half and retried, down to single calls, so one bad item or a node
+        batch-size limit never loses the rest of the batch.
+    """
+    results = []
+    for start in range(0, len(calls), batch_size):
+        results.extend(_send_batch(w3, calls[start:start + batch_size], return_exceptions))
+    return results
+
+
+def _call_one(call, return_exceptions):
+    if not return_exceptions:
+        return call()
+    try:
+        return call()
+    except Exception as e:
+        return e
+
+
+def _send_batch(w3, calls, return_exceptions):
+    if not calls:
+        return []
+    if len(calls) == 1 or not hasattr(w3, "batch_requests"):
+        return [_call_one(call, return_exceptions) for call in calls]
+    try:
+        with w3.batch_requests() as batch:
+            for call in calls:
+                batch.add(call())
+            return list(batch.execute())
+    except Exception:
+        mid = len(calls) // 2
+        return _send_batch(w3, calls[:mid], return_exceptions) + _send_batch(w3, calls[mid:], return_exceptions)
+
+
+def reset_block_receipts_support():
+    """
+        Forgets which endpoints rejected eth_getBlockReceipts, so each is assumed to support it again
+    """
+    with _support_lock:
+        _block_receipts_supported.clear()
+
+
+def get_transactions(w3, tx_hashes, batch_size=DEFAULT_BATCH_SIZE):
+    """
+        Returns the transactions for tx_hashes, fetched in JSON-RPC batches
+    """
+    return batch_call(w3, [lambda h=h: w3.eth.get_transaction(h) for h in tx_hashes], batch_size)
+
+
+def get_block_receipts(w3, block_num, batch_size=DEFAULT_BATCH_SIZE):
+    """
+        Returns every transaction receipt in block block_num.
+        Uses eth_getBlockReceipts when the node supports it (one request), otherwise fetches the
+        block's transaction hashes and the receipts in batches of eth_getTransactionReceipt.
+    """
+    endpoint = endpoint_key(w3)
+    with _support_lock:
+        supported = _block_receipts_supported.get(endpoint, True)
+
+    if supported and hasattr(w3.eth, "get_block_receipts"):
+        try:
+            return list(w3.eth.get_block_receipts(block_num))
+        except Exception as e:
+            if any(marker in str(e).lower() for marker in _UNSUPPORTED_MARKERS):
+                with _support_lock:
+                    _block_receipts_supported[endpoint] = False
+
+    block = w3.eth.get_block(block_num, full_transactions=False)
+    tx_hashes = [tx if isinstance(tx, (bytes, str)) else tx["hash"] for tx in block["transactions"]]
+    return batch_call(w3, [lambda h=h: w3.eth.get_transaction_receipt(h) for h in tx_hashes], batch_size)
@@ -0,0 +1,228 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from eth_utils import keccak
+import providers
+
+
+CASSETTE_VERSION = 1
+
+
+def request_key(chain, method, params):
+    """
+        Returns the string a JSON-RPC request is recorded under; params are compared as canonical JSON
+    """
+    return json.dumps([chain, method, params], sort_keys=True, separators=(",", ":"))
+
+
+class Cassette:
+    """
+        Recorded JSON-RPC traffic for one or more chains.
+        Each distinct (chain, method, params) request keeps every response it got, in order.
+        On replay, repeated requests are answered with those responses in turn, and the last one
+        is repeated once they run out, so polled values like eth_blockNumber advance as they did live.
+    """
+
+    def __init__(self, interactions=None, meta=None):
+        # key -> list of response objects ({"result": ...} or {"error": ...})
+        self.interactions = interactions if interactions is not None else {}
+        self.meta = meta if meta is not None else {}
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "r") as f:
+            data = json.load(f)
+        if data.get("version") != CASSETTE_VERSION:
+            raise ValueError(f"Unsupported cassette version {data.get('version')} in {path}")
+        interactions = {}
+        for entry in data["interactions"]:
+            key = request_key(entry["chain"], entry["method"], entry["params"])
+            interactions[key] = entry["responses"]
+        return cls(interactions, data.get("meta", {}))
+
+    def save(self, path):
+        with self._lock:
+            entries = []
+            for key, responses in self.interactions.items():
+                chain, method, params = json.loads(key)
+                entries.append({"chain": chain, "method": method, "params": params, "responses": responses})
+        with open(path, "w") as f:
+            json.dump({"version": CASSETTE_VERSION, "meta": self.meta, "interactions": entries}, f)
+
+    def record(self, chain, method, params, response):
+        body = {k: v for k, v in response.items() if k in ("result", "error")}
+        with self._lock:
+            self.interactions.setdefault(request_key(chain, method, params), []).append(body)
+
+    def lookup(self, chain, method, params):
+        """
+            Returns the next recorded response for the request, or None if it was never recorded
+        """
+        key = request_key(chain, method, params)
+        with self._lock:
+            responses = self.interactions.get(key)
+            if not responses:
+                return None
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            return responses[min(position, len(responses) - 1)]
+
+    def rewind(self):
+        """
+            Starts every request's responses from the first one again
+        """
+        with self._lock:
+            self._positions = {}
+
+
+class CassetteServer:
+    """
+        Local JSON-RPC server over HTTP that records to or replays from a Cassette.
+        Each chain is served under its own path, http://host:port/<chain>.
+
+        mode - "replay" answers from the cassette; "record" forwards each request to
+               upstreams[chain] and records the answer
+        upstreams - dict chain -> RPC URL, needed for record mode
+        latency, jitter - seconds added to every HTTP request (latency + uniform(0, jitter))
+        error_rate - fraction of HTTP requests that fail instead of being answered
+        error_kind - "rpc" fails with a JSON-RPC rate-limit error, "http" with HTTP 503
+        forward_writes - in record mode, forward eth_sendRawTransaction upstream. By default sends are
+                         not broadcast; the transaction hash is computed locally and recorded instead.
+
+        Counters http_requests, rpc_calls and injected_errors track what was served since reset_counters().
+    """
+
+    def __init__(self, cassette=None, mode="replay", upstreams=None, latency=0.0, jitter=0.0,
+                 error_rate=0.0, error_kind="rpc", seed=None, forward_writes=False, host="127.0.0.1", port=0):
+        if mode not in ("replay", "record"):
+            raise ValueError(f"Unknown mode {mode}")
+        if error_kind not in ("rpc", "http"):
+            raise ValueError(f"Unknown error kind {error_kind}")
+        self.cassette = cassette if cassette is not None else Cassette()
+        self.mode = mode
+        self.upstreams = upstreams if upstreams is not None else {}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_kind = error_kind
+        self.forward_writes = forward_writes
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.reset_counters()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def chain_url(self, chain):
+        return f"{self.url}/{chain}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_counters(self):
+        with self._lock:
+            self.http_requests = 0
+            self.rpc_calls = 0
+            self.injected_errors = 0
+
+    def _count(self, calls, injected=False):
+        with self._lock:
+            self.http_requests += 1
+            self.rpc_calls += calls
+            self.injected_errors += int(injected)
+
+    def _inject(self):
+        """
+            Sleeps for the configured latency, then returns True if this request should fail
+        """
+        with self._lock:
+            delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+            fail = self.error_rate > 0 and self._random.random() < self.error_rate
+        if delay > 0:
+            time.sleep(delay)
+        return fail
+
+    def _forward(self, chain, request):
+        method, params = request["method"], request.get("params", [])
+        if method == "eth_sendRawTransaction" and not self.forward_writes:
+            raw_tx = bytes.fromhex(params[0][2:] if params[0].startswith("0x") else params[0])
+            response = {"result": "0x" + keccak(raw_tx).hex()}
+        else:
+            upstream = self.upstreams.get(chain)
+            if upstream is None:
+                return {"error": {"code": -32000, "message": f"No upstream for chain {chain}"}}
+            reply = providers.get_session().post(
+                upstream, json={"jsonrpc": "2.0", "id": 1, "method": method, "params": params},
+                timeout=providers.REQUEST_TIMEOUT
+            )
+            reply.raise_for_status()
+            response = reply.json()
+        self.cassette.record(chain, method, params, response)
+        return response
+
+    def _answer(self, chain, request):
+        method, params = request.get("method"), request.get("params", [])
+        if self.mode == "record":
+            try:
+                response = self._forward(chain, request)
+            except Exception as e:
+                response = {"error": {"code": -32603, "message": f"Upstream request failed: {e}"}}
+        else:
+            response = self.cassette.lookup(chain, method, params)
+            if response is None:
+                response = {"error": {"code": -32000, "message": f"{method} not in cassette for {chain}"}}
+        answer = {"jsonrpc": "2.0", "id": request.get("id")}
+        answer.update({k: v for k, v in response.items() if k in ("result", "error")})
+        return answer
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                chain = self.path.strip("/")
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                requests = body if isinstance(body, list) else [body]
+                if server._inject():
+                    server._count(len(requests), injected=True)
+                    if server.error_kind == "http":
+                        self.send_error(503, "Injected error")
+                        return
+                    error = {"code": -32005, "message": "limit exceeded (injected)"}
+                    answers = [{"jsonrpc": "2.0", "id": r.get("id"), "error": error} for r in requests]
+                else:
+                    server._count(len(requests))
+                    answers = [server._answer(chain, r) for r in requests]
+                data = json.dumps(answers if isinstance(body, list) else answers[0]).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,214 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from web3.middleware import Web3Middleware
+
+
+# Latency histogram bucket upper bounds, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """
+        Count, error count and cumulative latency buckets for one series
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds, error=False):
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "sum": self.total,
+            "buckets": dict(zip([str(b) for b in BUCKETS], self.buckets)),
+        }
+
+
+class Metrics:
+    """
+        Process-wide latency record for JSON-RPC calls, keyed by (chain, method),
+        and for bridge phases, keyed by (chain, phase)
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rpc = {}
+        self.phases = {}
+
+    def observe_rpc(self, chain, method, seconds, error=False):
+        with self._lock:
+            self.rpc.setdefault((chain, method), Histogram()).observe(seconds, error)
+
+    def observe_batch(self, chain, methods, seconds, response=None):
+        """
+            Records a JSON-RPC batch as one observation of each request in it, under the request's own
+            method, with the batch's round trip as its latency.
+            response - the batch's responses in request order; a single error object, or None when the
+                       batch raised, fails every request in it
+        """
+        with self._lock:
+            for i, method in enumerate(methods):
+                error = not isinstance(response, list) or i >= len(response) or "error" in response[i]
+                self.rpc.setdefault((chain, method), Histogram()).observe(seconds, error)
+
+    def observe_phase(self, chain, phase, seconds, error=False):
+        with self._lock:
+            self.phases.setdefault((chain, phase), Histogram()).observe(seconds, error)
+
+    @contextmanager
+    def phase(self, chain, name):
+        """
+            Times the body of a with-block as one observation of phase name on chain
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.observe_phase(chain, name, time.perf_counter() - start, error=True)
+            raise
+        self.observe_phase(chain, name, time.perf_counter() - start)
+
+    def snapshot(self):
+        """
+            Returns every series as plain dicts, suitable for json.dump
+        """
+        with self._lock:
+            return {
+                "rpc": [dict(chain=c, method=m, **h.as_dict()) for (c, m), h in sorted(self.rpc.items())],
+                "phases": [dict(chain=c, phase=p, **h.as_dict()) for (c, p), h in sorted(self.phases.items())],
+            }
+
+    def write_snapshot(self, path):
+        with open(path, "w") as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def prometheus_text(self):
+        """
+            Returns every series in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            series = (
+                ("bridge_rpc", "method", self.rpc, "JSON-RPC request latency in seconds"),
+                ("bridge_phase", "phase", self.phases, "Bridge phase duration in seconds"),
+            )
+            for name, label, table, help_text in series:
+                lines.append(f"# HELP {name}_seconds {help_text}")
+                lines.append(f"# TYPE {name}_seconds histogram")
+                for (chain, key), h in sorted(table.items()):
+                    labels = f'chain="{chain}",{label}="{key}"'
+                    for bound, count in zip(BUCKETS, h.buckets):
+                        lines.append(f'{name}_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_seconds_bucket{{{labels},le="+Inf"}} {h.count}')
+                    lines.append(f"{name}_seconds_sum{{{labels}}} {h.total}")
+                    lines.append(f"{name}_seconds_count{{{labels}}} {h.count}")
+                lines.append(f"# TYPE {name}_errors_total counter")
+                for (chain, key), h in sorted(table.items()):
+                    lines.append(f'{name}_errors_total{{chain="{chain}",{label}="{key}"}} {h.errors}')
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port=9108, host="127.0.0.1"):
+        """
+            Serves prometheus_text() at http://host:port/metrics on a background thread.
+            Returns the server; call shutdown() on it to stop.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+METRICS = Metrics()
+
+
+def metrics_middleware(chain, metrics=METRICS):
+    """
+        Returns a web3 middleware class that records every request made through it
+        under chain in metrics, including each request of a batch under its own method.
+        Add it with w3.middleware_onion.add(metrics_middleware(chain)).
+    """
+
+    class RPCMetricsMiddleware(Web3Middleware):
+
+        def wrap_make_request(self, make_request):
+            def middleware(method, params):
+                start = time.perf_counter()
+                try:
+                    response = make_request(method, params)
+                except Exception:
+                    metrics.observe_rpc(chain, method, time.perf_counter() - start, error=True)
+                    raise
+                metrics.observe_rpc(chain, method, time.perf_counter() - start, error="error" in response)
+                return response
+            return middleware
+
+        def wrap_make_batch_request(self, make_batch_request):
+            def middleware(requests_info):
+                methods = [method for method, _ in requests_info]
+                start = time.perf_counter()
+                try:
+                    response = make_batch_request(requests_info)
+                except Exception:
+                    metrics.observe_batch(chain, methods, time.perf_counter() - start)
+                    raise
+                metrics.observe_batch(chain, methods, time.perf_counter() - start, response)
+                return response
+            return middleware
+
+        async def async_wrap_make_request(self, make_request):
+            async def middleware(method, params):
+                start = time.perf_counter()
+                try:
+                    response = await make_request(method, params)
+                except Exception:
+                    metrics.observe_rpc(chain, method, time.perf_counter() - start, error=True)
+                    raise
+                metrics.observe_rpc(chain, method, time.perf_counter() - start, error="error" in response)
+                return response
+            return middleware
+
+        async def async_wrap_make_batch_request(self, make_batch_request):
+            async def middleware(requests_info):
+                methods = [method for method, _ in requests_info]
+                start = time.perf_counter()
+                try:
+                    response = await make_batch_request(requests_info)
+                except Exception:
+                    metrics.observe_batch(chain, methods, time.perf_counter() - start)
+                    raise
+                metrics.observe_batch(chain, methods, time.perf_counter() - start, response)
+                return response
+            return middleware
+
+    return RPCMetricsMiddleware
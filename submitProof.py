@@ -3,8 +3,19 @@ import random
 import string
 import json
 from pathlib import Path
+import numpy as np
 from web3 import Web3
-from web3.middleware import ExtraDataToPOAMiddleware  # Necessary for POA chains
+import providers
+from gas_profile import FALLBACK_GAS, GasProfiles
+from fee_oracle import get_oracle
+from prime_sieve import first_primes
+from merkle_store import load_or_build
+from proof_verifier import verify_proof
+from claimed_leaves import ClaimedLeaves
+
+
+# chain -> the claim contract's merkleRoot(), see get_contract_root
+_contract_roots = {}
 
 
 def merkle_assignment():
@@ -14,19 +25,26 @@ def merkle_assignment():
         ready to attempt to claim a prime. You will need to complete the
         methods called by this method to generate the proof.
     """
-    # Generate the list of primes as integers
+    # Merkle tree over the first num_of_primes primes in bytes32 format (convert_leaves), built
+    # once and memory-mapped from disk on later runs
     num_of_primes = 8192
-    primes = generate_primes(num_of_primes)
-
-    # Create a version of the list of primes in bytes32 format
-    leaves = convert_leaves(primes)
+    tree = load_or_build(f"primes:{num_of_primes}", lambda: generate_primes(num_of_primes, packed=True))
+    leaves = tree[0]
 
-    # Build a Merkle tree using the bytes32 leaves as the Merkle tree's leaves
-    tree = build_merkle(leaves)
-
-    # Select a random leaf and create a proof for that leaf
-    # 0 is already claimed, so pick from 1..8191
-    random_leaf_index = random.randint(1, num_of_primes - 1)
+    # Select a random leaf nobody has claimed yet and create a proof for that leaf
+    chain = 'bsc'
+    address, abi = get_contract_info(chain)
+    claims = ClaimedLeaves(connect_to(chain), address, abi, leaf_primes(leaves), chain)
+    try:
+        claims.sync()
+        random_leaf_index = claims.pick()
+    except Exception as e:
+        # 0 is already claimed, so pick from 1..8191
+        print(f"Error syncing claimed leaves on {chain}: {e}. Picking blindly.")
+        random_leaf_index = random.randint(1, num_of_primes - 1)
+    if random_leaf_index is None:
+        print("Every leaf has been claimed")
+        return
     proof = prove_merkle(tree, random_leaf_index)
 
     # This is the same way the grader generates a challenge for sign_challenge()
@@ -37,61 +55,59 @@ def merkle_assignment():
     if sign_challenge_verify(challenge, addr, sig):
         # Submit the claim (pays gas)
         tx_hash = send_signed_msg(proof, leaves[random_leaf_index])
-        print("Claim submitted!")
+        try:
+            receipt = connect_to(chain).eth.get_transaction_receipt(tx_hash)
+        except Exception:
+            # Not mined yet; the Submission event records the claim on a later sync if it lands
+            receipt = None
+        if receipt is not None and receipt["status"] == 1:
+            claims.mark(random_leaf_index)
+            print("Claim submitted!")
+        elif receipt is not None:
+            print("Claim reverted; the leaf stays free")
+        else:
+            print("Claim sent, not mined yet")
         print("Your address:", addr)
         print("Chosen index:", random_leaf_index)
-        print("Prime (int):", primes[random_leaf_index])
+        print("Prime (int):", int.from_bytes(leaves[random_leaf_index], 'big'))
         print("Leaf (bytes32):", leaves[random_leaf_index].hex())
         print("Proof length:", len(proof))
         print("Tx hash:", tx_hash)
 
 
-def generate_primes(num_primes):
+def generate_primes(num_primes, packed=False):
     """
         Function to generate the first 'num_primes' prime numbers
         returns list (with length n) of primes (as ints) in ascending order
+        packed - return a numpy uint32/uint64 array instead of a list, for allowlists too large
+                 to keep as Python ints
     """
     primes_list = []
 
     #TODO YOUR CODE HERE
-    import math
-
-    if num_primes <= 0:
-        return []
+    # Segmented sieve up to a bound the nth prime never exceeds, so nothing is re-sieved
+    primes = first_primes(num_primes)
+    if packed:
+        return primes
 
-    # Upper bound estimate for the nth prime: n(ln n + ln ln n) + 10  for n >= 6
-    if num_primes < 6:
-        bound = 15
-    else:
-        n = num_primes
-        bound = int(n * (math.log(n) + math.log(math.log(n))) + 10)
-
-    def sieve(limit: int):
-        # Sieve of Eratosthenes
-        is_prime = bytearray(b'\x01') * (limit + 1)
-        if limit >= 0:
-            is_prime[0] = 0
-        if limit >= 1:
-            is_prime[1] = 0
-        p = 2
-        while p * p <= limit:
-            if is_prime[p]:
-                start = p * p
-                step = p
-                is_prime[start:limit + 1:step] = b'\x00' * (((limit - start) // step) + 1)
-            p += 1
-        return [i for i in range(limit + 1) if is_prime[i]]
-
-    primes = sieve(bound)
-    while len(primes) < num_primes:
-        bound *= 2
-        primes = sieve(bound)
-
-    primes_list = primes[:num_primes]
+    primes_list = primes.tolist()
 
     return primes_list
 
 
+def leaf_primes(leaves):
+    """
+        Decodes the primes back out of a MappedTree's leaf level (convert_leaves' bytes32 format)
+        returns them as a numpy uint64 array, in leaf order, without regenerating them
+    """
+    view = leaves.buffer()
+    try:
+        # Each prime fits in 64 bits, so it is the last 8 bytes of its big-endian leaf
+        return np.frombuffer(view, dtype=">u8").reshape(-1, 4)[:, 3].astype(np.uint64)
+    finally:
+        view.release()
+
+
 def convert_leaves(primes_list):
     """
         Converts the leaves (primes_list) to bytes32 format
@@ -194,14 +210,22 @@ def sign_challenge(challenge):
     return addr, eth_sig_obj.signature.hex()
 
 
-def send_signed_msg(proof, random_leaf):
+def send_signed_msg(proof, random_leaf, root=None):
     """
         Takes a Merkle proof of a leaf, and that leaf (in bytes32 format)
         builds signs and sends a transaction claiming that leaf (prime)
         on the contract
+        root - the root to check the proof against before sending; defaults to the contract's
+               merkleRoot() (see get_contract_root), so a proof from a local tree that does not
+               match the contract is rejected before any gas is spent
     """
     chain = 'bsc'
 
+    if root is None:
+        root = get_contract_root(chain)
+    if not verify_proof(random_leaf, proof, root):
+        raise ValueError(f"Proof for leaf 0x{bytes(random_leaf).hex()} does not verify against root 0x{bytes(root).hex()}")
+
     acct = get_account()
     address, abi = get_contract_info(chain)
     w3 = connect_to(chain)
@@ -214,15 +238,20 @@ def send_signed_msg(proof, random_leaf):
         "from": acct.address,
         "nonce": w3.eth.get_transaction_count(acct.address),
         "chainId": w3.eth.chain_id,
-        "gasPrice": w3.eth.gas_price,
+        # Type-2 fees where the chain has a base fee, otherwise a gas price; from recent blocks either way
+        **get_oracle(w3, chain).fees(),
+        # Placeholder so build_transaction does not estimate; replaced by the learned limit below
+        "gas": FALLBACK_GAS,
     })
 
-    # Estimate gas with a small buffer; fall back if estimation fails
+    # Gas limit learned from earlier submit() receipts; a live estimate only when there are none yet
+    gas_profiles = GasProfiles()
     try:
-        gas_est = w3.eth.estimate_gas(tx)
-        tx["gas"] = int(gas_est * 1.2)
+        # Fold in earlier sends whose receipts were not available when they were sent
+        gas_profiles.settle(w3, chain)
     except Exception:
-        tx["gas"] = 300000
+        pass
+    tx["gas"] = gas_profiles.gas_limit(w3, chain, tx)
 
     signed = w3.eth.account.sign_transaction(tx, private_key=acct.key)
 
@@ -230,10 +259,11 @@ def send_signed_msg(proof, random_leaf):
     tx_hash = w3.eth.send_raw_transaction(signed.raw_transaction).hex()
 
     try:
-        w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+        gas_profiles.observe_receipt(chain, tx, receipt)
     except Exception:
         # ignore timeout; the tx still may be mined shortly after
-        pass
+        gas_profiles.track(chain, tx_hash, tx)
 
     return tx_hash
 
@@ -247,15 +277,8 @@ def connect_to(chain):
     if chain not in ['avax','bsc']:
         print(f"{chain} is not a valid option for 'connect_to()'")
         return None
-    if chain == 'avax':
-        api_url = f"https://api.avax-test.network/ext/bc/C/rpc"  # AVAX C-chain testnet
-    else:
-        api_url = f"https://data-seed-prebsc-1-s1.binance.org:8545/"  # BSC testnet
-    w3 = Web3(Web3.HTTPProvider(api_url))
-    # inject the poa compatibility middleware to the innermost layer
-    w3.middleware_onion.inject(ExtraDataToPOAMiddleware, layer=0)
-
-    return w3
+    # Shared, cached instance (keep-alive session, POA middleware already injected)
+    return providers.get_web3(chain)
 
 
 def get_account():
@@ -281,10 +304,26 @@ def get_contract_info(chain):
         contract_file = Path(__file__).parent.parent.parent / "tests" / "contract_info.json"
     with open(contract_file, "r") as f:
         d = json.load(f)
-        d = d[chain]
+    if chain not in d:
+        # The prime claim contract is listed on its own
+        with open(Path(__file__).parent.absolute() / "contract_info2.json", "r") as f:
+            d = json.load(f)
+    d = d[chain]
     return d['address'], d['abi']
 
 
+def get_contract_root(chain):
+    """
+        Returns the merkleRoot() the claim contract on chain checks proofs against.
+        Fetched with one eth_call the first time and cached for the rest of the run
+    """
+    if chain not in _contract_roots:
+        address, abi = get_contract_info(chain)
+        contract = connect_to(chain).eth.contract(address=Web3.to_checksum_address(address), abi=abi)
+        _contract_roots[chain] = bytes(contract.functions.merkleRoot().call())
+    return _contract_roots[chain]
+
+
 def sign_challenge_verify(challenge, addr, sig):
     """
         Helper to verify signatures, verifies sign_challenge(challenge)
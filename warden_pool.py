@@ -0,0 +1,183 @@
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from eth_account import Account
+from eth_utils import keccak
+from nonce_manager import DEFAULT_NONCE_DB, NonceManager
+from relay_pipeline import ChainParams, RelayPipeline, get_tracker
+from rpc_batch import batch_call
+
+
+# Most broadcast-but-unmined transactions a warden key may have before new relays go to another key;
+# public nodes start dropping an account's queued transactions well above this
+DEFAULT_MAX_PENDING = 16
+
+# (chain, partition key) -> lane index, shared by every WardenPool in the process so a token keeps
+# the key it was first given
+_sticky_lanes = {}
+_sticky_next = {}
+_sticky_lock = threading.Lock()
+
+
+def reset_sticky_lanes():
+    """
+        Forgets which key each partition key was given, so the next relays are assigned round-robin afresh
+    """
+    with _sticky_lock:
+        _sticky_lanes.clear()
+        _sticky_next.clear()
+
+
+class BudgetExhausted(Exception):
+    """
+        Raised for a relay that was not sent because every warden key had its pending budget in use
+    """
+
+
+class WardenLane:
+    """
+        One warden key on one chain: its own nonce stream and pending-transaction budget
+    """
+
+    def __init__(self, private_key, w3, chain, nonce_db=DEFAULT_NONCE_DB, max_pending=DEFAULT_MAX_PENDING):
+        self.private_key = private_key
+        self.address = Account.from_key(private_key).address
+        self.nonces = NonceManager(w3, chain, self.address, nonce_db)
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.assigned = 0
+
+    def sync(self, pending, latest):
+        """
+            pending, latest - the key's transaction counts at the "pending" and "latest" block tags
+        """
+        self.nonces.sync(pending, latest)
+        self.in_flight = max(pending - latest, 0)
+        self.assigned = 0
+
+    def budget(self):
+        return max(self.max_pending - self.in_flight - self.assigned, 0)
+
+
+class WardenPool:
+    """
+        Relays transactions from several warden keys, each with its own nonce sequence, so one
+        account's mempool limits do not cap relay throughput. Every key must hold WARDEN_ROLE on
+        the contract being called.
+
+        partition - how calls are spread over the keys: "sticky" gives each new partition key
+                    (e.g. a token) the next key round-robin and keeps it there; "token" hashes the
+                    partition key, so the mapping is the same in every process
+        max_pending - per-key budget of broadcast transactions not yet mined. A call whose key is
+                      at its budget goes to the key with the most room left; if no key has room it
+                      fails with BudgetExhausted and is left for a later scan.
+    """
+
+    def __init__(self, keys, w3, chain, nonce_db=DEFAULT_NONCE_DB, max_pending=DEFAULT_MAX_PENDING,
+                 partition="sticky"):
+        if not keys:
+            raise ValueError("WardenPool needs at least one key")
+        if partition not in ("sticky", "token"):
+            raise ValueError(f"Unknown partition {partition}")
+        self.w3 = w3
+        self.chain = chain
+        self.partition = partition
+        self.lanes = [WardenLane(key, w3, chain, nonce_db, max_pending) for key in keys]
+
+    def sync(self):
+        """
+            Fetches every key's pending and mined transaction counts in one batch and syncs its nonces
+        """
+        counts = batch_call(self.w3, [
+            call
+            for lane in self.lanes
+            for call in (
+                lambda a=lane.address: self.w3.eth.get_transaction_count(a, "pending"),
+                lambda a=lane.address: self.w3.eth.get_transaction_count(a, "latest"),
+            )
+        ])
+        for i, lane in enumerate(self.lanes):
+            lane.sync(counts[2 * i], counts[2 * i + 1])
+
+    def preferred_lane(self, partition_key):
+        if len(self.lanes) == 1:
+            return 0
+        partition_key = bytes(partition_key) if not isinstance(partition_key, str) else partition_key.encode()
+        if self.partition == "token":
+            return int.from_bytes(keccak(partition_key)[:4], "big") % len(self.lanes)
+        with _sticky_lock:
+            key = (self.chain, partition_key)
+            if key not in _sticky_lanes:
+                lane = _sticky_next.get(self.chain, 0) % len(self.lanes)
+                _sticky_next[self.chain] = lane + 1
+                _sticky_lanes[key] = lane
+            return _sticky_lanes[key] % len(self.lanes)
+
+    def assign(self, partition_keys):
+        """
+            Returns the lane index for each partition key, or None where no lane has budget left
+        """
+        assignments = []
+        for partition_key in partition_keys:
+            lane = self.preferred_lane(partition_key)
+            if self.lanes[lane].budget() == 0:
+                lane = max(range(len(self.lanes)), key=lambda i: self.lanes[i].budget())
+                if self.lanes[lane].budget() == 0:
+                    assignments.append(None)
+                    continue
+            self.lanes[lane].assigned += 1
+            assignments.append(lane)
+        return assignments
+
+    def relay_all(self, contract, fn_name, calls, partition_keys, on_sent=None, on_confirmed=None, sign_workers=4,
+                  **pipeline_kwargs):
+        """
+            Sends fn_name(*call_args) for each call_args in calls, spread over the keys by partition_keys.
+            Each key's relays go through its own RelayPipeline; all of them share one signing pool.
+            Every broadcast transaction is followed by its key's process-wide ConfirmationTracker, which
+            feeds the receipt to the gas profiles, if any, once it is mined. Nothing waits for that.
+            partition_keys - one key per call, normally the token it moves; also passed to the
+                             pipelines as the gas profile token
+            on_sent - optional callable (index, tx_hash) run as soon as calls[index] is broadcast
+            on_confirmed - optional callable (index, tx_hash, receipt) run on the tracker's thread once
+                           calls[index] is mined; receipt is None if another transaction took its nonce
+            pipeline_kwargs - passed on to every RelayPipeline
+            Returns a list with the transaction hash, or the exception raised, for each call.
+        """
+        assignments = self.assign(partition_keys)
+        sign_executor = ProcessPoolExecutor(max_workers=sign_workers)
+        params = pipeline_kwargs.pop("params", None) or ChainParams(self.w3)
+        pipelines = {}
+        futures = []
+        try:
+            for call_args, partition_key, lane in zip(calls, partition_keys, assignments):
+                if lane is None:
+                    future = Future()
+                    future.set_exception(BudgetExhausted(f"Every warden key on {self.chain} is at its pending budget"))
+                    futures.append(future)
+                    continue
+                if lane not in pipelines:
+                    pipelines[lane] = RelayPipeline(
+                        self.w3, contract, fn_name, self.lanes[lane].private_key, self.lanes[lane].nonces,
+                        sign_executor=sign_executor, params=params,
+                        tracker=get_tracker(self.w3, self.chain, self.lanes[lane].address), **pipeline_kwargs
+                    )
+                confirmed = None if on_confirmed is None else (
+                    lambda tx_hash, receipt, i=len(futures): on_confirmed(i, tx_hash, receipt)
+                )
+                futures.append(pipelines[lane].submit(call_args, token=partition_key, on_confirmed=confirmed))
+            if on_sent is not None:
+                for i, future in enumerate(futures):
+                    future.add_done_callback(
+                        lambda f, i=i: on_sent(i, f.result()) if f.exception() is None else None
+                    )
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(e)
+            return results
+        finally:
+            for pipeline in pipelines.values():
+                pipeline.close()
+            sign_executor.shutdown(wait=True)